@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict
+
+# Running disk usage, saved so a new worker doesn't rescan the directory
+SIZE_FILE = 'disk-bytes'
+# How much may be written between saves of SIZE_FILE
+SIZE_SAVE_BYTES = 4 * 1024 * 1024
+
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA-1 git assigns to a blob with this content"""
+    header = f"blob {len(data)}\0".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+
+class BlobStore:
+    """Content-addressed store for file bodies keyed by git blob SHA.
+
+    Recently used blobs stay in a bounded in-memory LRU; everything is also
+    written to ``root/ab/cdef...`` so other workers and later sessions can
+    read it without touching the network. Identical files in different repos
+    or branches share one entry. The disk copy is trimmed by modification
+    time (refreshed on read) once it grows past ``max_disk_bytes``.
+
+    ``get`` and ``put`` do blocking file I/O; async code should use ``aget``
+    and ``aput``, which serve memory hits inline and run disk access in a
+    thread.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_memory_bytes: int = 32 * 1024 * 1024,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: int | None = self._load_size()
+        self._unsaved_bytes = 0
+        self._lock = threading.Lock()
+
+    def _load_size(self) -> int | None:
+        try:
+            return int((self.root / SIZE_FILE).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _save_size(self, size: int):
+        tmp = self.root / f"{SIZE_FILE}.{os.getpid()}.tmp"
+        try:
+            tmp.write_text(str(size))
+            os.replace(tmp, self.root / SIZE_FILE)
+        except OSError:
+            pass
+
+    def _path(self, sha: str) -> Path:
+        return self.root / sha[:2] / sha[2:]
+
+    def __contains__(self, sha: str) -> bool:
+        return sha in self._memory or self._path(sha).exists()
+
+    def _from_memory(self, sha: str) -> bytes | None:
+        with self._lock:
+            data = self._memory.get(sha)
+            if data is not None:
+                self._memory.move_to_end(sha)
+            return data
+
+    def get(self, sha: str) -> bytes | None:
+        """Return the blob body or None if it isn't stored"""
+        data = self._from_memory(sha)
+        if data is not None:
+            return data
+        path = self._path(sha)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._remember(sha, data)
+        return data
+
+    def put(self, sha: str, data: bytes):
+        """Store a blob body under its git SHA"""
+        self._remember(sha, data)
+        path = self._path(sha)
+        if path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+        # Write then rename so concurrent readers never see a partial blob
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(data)
+                self._unsaved_bytes += len(data)
+            over = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+            save = not over and self._unsaved_bytes >= SIZE_SAVE_BYTES
+            if save:
+                self._unsaved_bytes = 0
+        if over:
+            self._trim_disk()
+        elif save:
+            self._save_size(self._disk_bytes)
+
+    async def aget(self, sha: str) -> bytes | None:
+        """``get`` without blocking the event loop on disk reads"""
+        data = self._from_memory(sha)
+        if data is not None:
+            return data
+        return await asyncio.to_thread(self.get, sha)
+
+    async def aput(self, sha: str, data: bytes):
+        """``put`` without blocking the event loop on disk writes or trimming"""
+        await asyncio.to_thread(self.put, sha, data)
+
+    def _remember(self, sha: str, data: bytes):
+        if len(data) > self.max_memory_bytes // 4:
+            return
+        with self._lock:
+            if sha in self._memory:
+                self._memory.move_to_end(sha)
+                return
+            self._memory[sha] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _trim_disk(self):
+        """Recount disk usage and delete least recently used blobs over budget"""
+        files = []
+        total = 0
+        for path in self.root.glob('??/*'):
+            if path.name.endswith('.tmp'):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total > self.max_disk_bytes:
+            files.sort()
+            # Trim to 90% so we don't rescan on every put
+            target = self.max_disk_bytes * 0.9
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._disk_bytes = total
+            self._unsaved_bytes = 0
+        self._save_size(total)
+
+
+# One store per directory per process, like the metadata cache.
+_stores: Dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_blob_store(
+    root: str,
+    max_memory_bytes: int = 32 * 1024 * 1024,
+    max_disk_bytes: int = 512 * 1024 * 1024,
+) -> BlobStore:
+    """Return the process-wide blob store for ``root``, creating it on first use"""
+    key = str(Path(root).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = BlobStore(
+                root,
+                max_memory_bytes=max_memory_bytes,
+                max_disk_bytes=max_disk_bytes,
+            )
+            _stores[key] = store
+        return store
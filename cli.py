@@ -3,12 +3,13 @@ from dotenv import load_dotenv
 from typing import List
 import asyncio
 import logfire
-import httpx
 import os
 import re
 
-from pydantic_ai.messages import ModelMessage, ModelRequest, ModelResponse, TextPart, UserPromptPart
+from pydantic_ai.messages import ModelMessage
 from github_agent import github_agent, GitHubDeps
+from history_manager import compact_history, DEFAULT_HISTORY_TOKENS
+from http_client import create_http_client
 
 # Load environment variables
 load_dotenv()
@@ -19,9 +20,12 @@ logfire.configure(send_to_logfire='never')
 class CLI:
     def __init__(self):
         self.messages: List[ModelMessage] = []
+        self.max_history_tokens = int(os.getenv('HISTORY_MAX_TOKENS', DEFAULT_HISTORY_TOKENS))
         self.deps = GitHubDeps(
-            client=httpx.AsyncClient(),
+            client=create_http_client(),
             github_token=os.getenv('GITHUB_TOKEN'),
+            snapshot_mode=os.getenv('GITHUB_SNAPSHOT_MODE', '').lower() == 'true',
+            git_mirrors=os.getenv('GITHUB_GIT_MIRRORS', '').lower() == 'true',
         )
         self.current_repo: str | None = None
         self.current_path: str | None = None
@@ -56,14 +60,9 @@ class CLI:
                     message_history=self.messages
                 )
 
-                # Store messages and print result
-                self.messages.append(ModelRequest(parts=[UserPromptPart(content=user_input)]))
-                filtered_messages = [msg for msg in result.new_messages() 
-                                if not (hasattr(msg, 'parts') and 
-                                        any(part.part_kind == 'user-prompt' or part.part_kind == 'text' for part in msg.parts))]
-                self.messages.extend(filtered_messages)
+                # Keep the whole run, tool calls included, trimmed to the token budget
+                self.messages = compact_history(result.all_messages(), max_tokens=self.max_history_tokens)
                 print(result.data)
-                self.messages.append(ModelResponse(parts=[TextPart(content=result.data)]))
 
         finally:
             await self.deps.client.aclose()
@@ -0,0 +1,240 @@
+import asyncio
+import gzip
+import json
+import re
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+from repo_tree import RepoTree, glob_to_regex
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Files bigger than this aren't indexed; they are rarely hand-written code
+MAX_INDEXED_FILE_BYTES = 256 * 1024
+MAX_LINE_CHARS = 200
+# Candidate bodies are loaded in batches of about this size, then scanned in
+# a thread, so a search neither blocks the event loop nor holds every file
+SCAN_BATCH_BYTES = 4 * 1024 * 1024
+BINARY_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.ico', '.pdf', '.zip', '.gz', '.tgz',
+    '.jar', '.whl', '.so', '.dll', '.exe', '.woff', '.woff2', '.ttf', '.eot',
+    '.mp3', '.mp4', '.mov', '.pyc', '.class', '.bin', '.lock',
+}
+
+
+def trigrams(text: str) -> Set[str]:
+    """Lowercased 3-character substrings of ``text``"""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def decode_text(data: bytes) -> str | None:
+    """File body as text, or None if it looks binary"""
+    if b'\0' in data[:8192]:
+        return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def required_literals(pattern: str) -> List[str]:
+    """Literal strings every match of the regex ``pattern`` must contain.
+
+    Collects runs of plain characters from the pattern's top-level sequence
+    and from plain groups in it; anything optional, repeated or alternative
+    ends a run. An empty list means the index can't narrow the search.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return []
+    return [literal for literal in _sequence_literals(parsed) if len(literal) >= 3]
+
+
+def _sequence_literals(parsed) -> List[str]:
+    literals, run = [], []
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg))
+            continue
+        if run:
+            literals.append(''.join(run))
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            literals.extend(_sequence_literals(arg[-1]))
+    if run:
+        literals.append(''.join(run))
+    return literals
+
+
+def indexable_files(tree: RepoTree, max_file_bytes: int = MAX_INDEXED_FILE_BYTES) -> List[Tuple[str, str]]:
+    """(path, blob sha) of the files worth indexing in a tree"""
+    files = []
+    for path in tree.paths:
+        item = tree.lookup(path)
+        if item['type'] != 'blob' or item['size'] > max_file_bytes:
+            continue
+        if Path(path).suffix.lower() in BINARY_EXTENSIONS:
+            continue
+        files.append((path, item['sha']))
+    return files
+
+
+class TrigramIndex:
+    """Inverted index from trigrams to the files that contain them.
+
+    Holds only file paths, blob SHAs and posting lists; file bodies stay in
+    the blob store and are read back to confirm candidate matches, so the
+    index is small enough to keep per repo and commit. Trigrams are
+    lowercased, so one index serves case-sensitive and -insensitive search.
+    """
+
+    def __init__(self):
+        self.files: Dict[str, str] = {}
+        self._ids: Dict[str, int] = {}
+        self._paths: List[str | None] = []
+        self.postings: Dict[str, Set[int]] = {}
+        # Indexable files left out because the repo was over the file cap
+        self.skipped = 0
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def copy(self) -> 'TrigramIndex':
+        index = TrigramIndex()
+        index.files = dict(self.files)
+        index._ids = dict(self._ids)
+        index._paths = list(self._paths)
+        index.postings = {gram: set(ids) for gram, ids in self.postings.items()}
+        index.skipped = self.skipped
+        return index
+
+    def add(self, path: str, sha: str, text: str):
+        if path in self.files:
+            self.remove(path, text=None)
+        file_id = len(self._paths)
+        self._paths.append(path)
+        self._ids[path] = file_id
+        self.files[path] = sha
+        for gram in trigrams(text):
+            self.postings.setdefault(gram, set()).add(file_id)
+
+    def remove(self, path: str, text: str | None):
+        """Drop a file; pass its old text to avoid scanning every posting list"""
+        file_id = self._ids.pop(path, None)
+        if file_id is None:
+            return
+        del self.files[path]
+        self._paths[file_id] = None
+        grams = trigrams(text) if text is not None else list(self.postings)
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(file_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def candidates(self, literals: Iterable[str]) -> List[str]:
+        """Paths that contain every trigram of every literal"""
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal)
+        if not grams:
+            return sorted(self.files)
+        lists = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        ids = set(lists[0])
+        for other in lists[1:]:
+            ids &= other
+            if not ids:
+                break
+        return sorted(self._paths[i] for i in ids)
+
+    async def search(
+        self,
+        query: str,
+        load: Callable[[str, str], Awaitable[bytes | None]],
+        regex: bool = False,
+        case_sensitive: bool = False,
+        path_pattern: str | None = None,
+        max_results: int = 50,
+    ) -> Tuple[List[Tuple[str, int, str]], int]:
+        """Find lines matching ``query``; returns ([(path, line number, line)], total hits).
+
+        ``load(path, sha)`` returns a file body, normally from the blob store.
+        Decoding and matching run in a worker thread.
+        """
+        flags = 0 if case_sensitive else re.IGNORECASE
+        matcher = re.compile(query if regex else re.escape(query), flags)
+        paths = self.candidates(required_literals(query) if regex else [query])
+        if path_pattern:
+            path_regex = glob_to_regex(path_pattern)
+            paths = [
+                p for p in paths
+                if path_regex.fullmatch(p if '/' in path_pattern else p.rsplit('/', 1)[-1])
+            ]
+        hits, total = [], 0
+
+        def scan(batch: List[Tuple[str, bytes]]):
+            nonlocal total
+            for path, data in batch:
+                text = decode_text(data)
+                if text is None:
+                    continue
+                for number, line in enumerate(text.splitlines(), 1):
+                    if matcher.search(line):
+                        total += 1
+                        if len(hits) < max_results:
+                            hits.append((path, number, line.strip()[:MAX_LINE_CHARS]))
+
+        batch, batch_bytes = [], 0
+        for path in paths:
+            data = await load(path, self.files[path])
+            if data is None:
+                continue
+            batch.append((path, data))
+            batch_bytes += len(data)
+            if batch_bytes >= SCAN_BATCH_BYTES:
+                await asyncio.to_thread(scan, batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            await asyncio.to_thread(scan, batch)
+        return hits, total
+
+    def to_json(self) -> dict:
+        paths = [p for p in self._paths if p is not None]
+        renumber = {self._ids[p]: i for i, p in enumerate(paths)}
+        return {
+            'files': [[p, self.files[p]] for p in paths],
+            'postings': {gram: sorted(renumber[i] for i in ids) for gram, ids in self.postings.items()},
+            'skipped': self.skipped,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'TrigramIndex':
+        index = cls()
+        for path, sha in data['files']:
+            index._ids[path] = len(index._paths)
+            index._paths.append(path)
+            index.files[path] = sha
+        index.postings = {gram: set(ids) for gram, ids in data['postings'].items()}
+        index.skipped = data.get('skipped', 0)
+        return index
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, separators=(',', ':'))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'TrigramIndex | None':
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return cls.from_json(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
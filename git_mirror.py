@@ -0,0 +1,202 @@
+import asyncio
+import base64
+import os
+import re
+import shutil
+import signal
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+DEFAULT_URL_TEMPLATE = 'https://github.com/{owner}/{repo}.git'
+# Touched on every use; its mtime orders mirrors for eviction
+LAST_USED_FILE = 'agent-last-used'
+
+
+class GitError(Exception):
+    """A git command failed"""
+
+
+class GitMirrorPool:
+    """Bare partial clones of repositories, served locally.
+
+    Each repo is cloned once with ``--filter=blob:none``, so the clone holds
+    commits and trees but downloads file bodies only when they are read.
+    Mirrors are refreshed with an incremental ``git fetch`` at most every
+    ``fetch_interval`` seconds. Once the mirrors use more than
+    ``max_disk_bytes``, the least recently used ones are deleted. A git
+    command running longer than ``timeout`` seconds is killed.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_disk_bytes: int = 2 * 1024 * 1024 * 1024,
+        fetch_interval: float = 60,
+        url_template: str = DEFAULT_URL_TEMPLATE,
+        timeout: float = 300,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_disk_bytes = max_disk_bytes
+        self.fetch_interval = fetch_interval
+        self.url_template = url_template
+        self.timeout = timeout
+        self._fetched: Dict[Path, float] = {}
+        self._locks: Dict[Path, asyncio.Lock] = {}
+
+    def path(self, owner: str, repo: str) -> Path:
+        safe = lambda name: re.sub(r'[^A-Za-z0-9._-]', '_', name)
+        return self.root / safe(owner) / f"{safe(repo)}.git"
+
+    async def _git(self, *args: str, cwd: Path | None = None, token: str | None = None) -> bytes:
+        env = {**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
+        if token:
+            # Passed through the environment so the token never lands in the
+            # mirror's config or the process list
+            basic = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+            env.update({
+                'GIT_CONFIG_COUNT': '1',
+                'GIT_CONFIG_KEY_0': 'http.extraHeader',
+                'GIT_CONFIG_VALUE_0': f"Authorization: Basic {basic}",
+            })
+        process = await asyncio.create_subprocess_exec(
+            'git', *args,
+            cwd=cwd,
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Own process group, so a timeout also kills remote helpers
+            start_new_session=True,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            raise GitError(f"git {args[0]} timed out after {self.timeout:g}s")
+        if process.returncode != 0:
+            raise GitError(f"git {args[0]} failed: {stderr.decode(errors='replace').strip()[:300]}")
+        return stdout
+
+    async def ensure(self, owner: str, repo: str, token: str | None = None) -> Path:
+        """Clone the repo if needed, or fetch if the mirror is older than fetch_interval"""
+        path = self.path(owner, repo)
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            if not (path / 'HEAD').exists():
+                url = self.url_template.format(owner=owner, repo=repo)
+                tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                shutil.rmtree(tmp, ignore_errors=True)
+                tmp.parent.mkdir(parents=True, exist_ok=True)
+                print(f"Cloning {owner}/{repo} into {path}")
+                try:
+                    await self._git('clone', '--bare', '--filter=blob:none', '--no-tags', url, str(tmp), token=token)
+                except GitError:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+                os.replace(tmp, path)
+                self._fetched[path] = time.monotonic()
+                changed = True
+            elif time.monotonic() - self._fetched.get(path, float('-inf')) > self.fetch_interval:
+                await self._git(
+                    'fetch', '--prune', '--no-tags', '--filter=blob:none', 'origin',
+                    '+refs/heads/*:refs/heads/*', cwd=path, token=token,
+                )
+                self._fetched[path] = time.monotonic()
+                changed = True
+            else:
+                changed = False
+            (path / LAST_USED_FILE).touch()
+        if changed:
+            # Sizes only grow noticeably on clone/fetch, so only rescan then;
+            # the scan stats every file, so keep it off the event loop
+            await asyncio.to_thread(self._evict, path)
+        return path
+
+    async def resolve_head(self, path: Path) -> Dict[str, str]:
+        """The default branch and its commit SHA, as {'branch', 'sha'}"""
+        ref = (await self._git('symbolic-ref', 'HEAD', cwd=path)).decode().strip()
+        sha = (await self._git('rev-parse', 'HEAD^{commit}', cwd=path)).decode().strip()
+        return {'branch': ref.removeprefix('refs/heads/'), 'sha': sha}
+
+    async def list_tree(self, path: Path, sha: str) -> List[Dict[str, Any]]:
+        """Every tree and blob at ``sha``, as GitHub tree API items.
+
+        Sizes are only known for blobs already downloaded; the rest are 0.
+        Asking git for them (``ls-tree -l``) would fetch every missing blob
+        one round-trip at a time, undoing the partial clone.
+        """
+        output = await self._git('ls-tree', '-r', '-t', '-z', sha, cwd=path)
+        sizes = await self._local_blob_sizes(path)
+        items = []
+        for record in output.split(b'\0'):
+            if not record:
+                continue
+            meta, _, name = record.partition(b'\t')
+            mode, kind, object_sha = meta.decode().split(None, 2)
+            if kind not in ('blob', 'tree'):
+                continue
+            items.append({
+                'path': name.decode('utf-8', 'surrogateescape'),
+                'mode': mode,
+                'type': kind,
+                'sha': object_sha,
+                'size': sizes.get(object_sha, 0) if kind == 'blob' else 0,
+            })
+        return items
+
+    async def _local_blob_sizes(self, path: Path) -> Dict[str, int]:
+        """Sizes of the blobs present in the mirror; only lists, never fetches"""
+        output = await self._git(
+            'cat-file', '--batch-all-objects', '--batch-check=%(objecttype) %(objectname) %(objectsize)',
+            cwd=path,
+        )
+        sizes = {}
+        for line in output.decode().splitlines():
+            kind, object_sha, size = line.split()
+            if kind == 'blob':
+                sizes[object_sha] = int(size)
+        return sizes
+
+    async def read_blob(self, path: Path, sha: str, token: str | None = None) -> bytes:
+        """A blob body; git fetches it from the remote on first read"""
+        return await self._git('cat-file', 'blob', sha, cwd=path, token=token)
+
+    def _evict(self, keep: Path):
+        mirrors = []
+        total = 0
+        for mirror in self.root.glob('*/*.git'):
+            size = sum(f.stat().st_size for f in mirror.rglob('*') if f.is_file())
+            marker = mirror / LAST_USED_FILE
+            used = marker.stat().st_mtime if marker.exists() else 0
+            mirrors.append((used, size, mirror))
+            total += size
+        if total <= self.max_disk_bytes:
+            return
+        for _, size, mirror in sorted(mirrors):
+            if total <= self.max_disk_bytes:
+                break
+            if mirror == keep or (mirror in self._locks and self._locks[mirror].locked()):
+                continue
+            print(f"Evicting git mirror {mirror}")
+            shutil.rmtree(mirror, ignore_errors=True)
+            self._fetched.pop(mirror, None)
+            total -= size
+
+
+# One pool per directory per process, like the blob store.
+_pools: Dict[str, GitMirrorPool] = {}
+
+
+def open_mirror_pool(root: str, **kwargs) -> GitMirrorPool:
+    """Return the process-wide mirror pool for ``root``, creating it on first use"""
+    key = str(Path(root).resolve())
+    pool = _pools.get(key)
+    if pool is None:
+        pool = GitMirrorPool(root, **kwargs)
+        _pools[key] = pool
+    return pool
@@ -1,15 +1,22 @@
 from __future__ import annotations as _annotations
+import functools
 import os
 import re
+import time
 from dotenv import load_dotenv
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.openai import OpenAIModel
 from github_deps import GitHubDeps
+from structure import render_structure
+from symbols import format_symbol, language_for
 from functools import lru_cache
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 load_dotenv()
 
+# How much of the README get_repo_info includes when it comes with the overview
+README_EXCERPT_CHARS = 1500
+
 def get_model():
     """Get the OpenAI model with proper error handling."""
     api_key = os.environ.get('OPENAI_API_KEY')
@@ -52,6 +59,11 @@ def initialize_agent():
         2. get_repo_structure - Get directory structure
         3. get_file_content - Read files
         4. get_directory_contents - List directory contents
+        5. find_files - Find files matching a glob pattern (e.g. "*.py", "src/**/test_*.py")
+        6. get_files - Read several files at once by path list or glob
+        7. search_code - Search file contents for text or a regex, returning path:line matches
+        8. find_symbol - Find where a function, class or method is defined, with its signature
+        9. outline_file - List the imports, classes and functions of a file without reading it
 
         If a tool returns an error, do not retry the same tool multiple times.
         Instead, acknowledge the error and offer alternative ways to help.
@@ -76,6 +88,11 @@ system_prompt = """You are a GitHub repository assistant. Use these tools:
 2. get_repo_structure - Get directory structure
 3. get_file_content - Read files
 4. get_directory_contents - List directory contents
+5. find_files - Find files matching a glob pattern (e.g. "*.py", "src/**/test_*.py")
+6. get_files - Read several files at once by path list or glob
+7. search_code - Search file contents for text or a regex, returning path:line matches
+8. find_symbol - Find where a function, class or method is defined, with its signature
+9. outline_file - List the imports, classes and functions of a file without reading it
 
 If a tool returns an error, do not retry the same tool multiple times.
 Instead, acknowledge the error and offer alternative ways to help.
@@ -94,9 +111,31 @@ github_agent = None
 repo_cache: Dict[str, Any] = {}
 error_cache: Dict[str, str] = {}
 
+def reports_progress(tool):
+    """Emit tool_start/tool_end events through ctx.deps so streaming clients see tool calls."""
+    @functools.wraps(tool)
+    async def wrapper(ctx: RunContext[GitHubDeps], *args, **kwargs):
+        started = time.monotonic()
+        ctx.deps.emit('tool_start', tool=tool.__name__, args=kwargs)
+        try:
+            result = await tool(ctx, *args, **kwargs)
+        except Exception as e:
+            ctx.deps.emit('tool_end', tool=tool.__name__, error=str(e),
+                          elapsed=round(time.monotonic() - started, 3))
+            raise
+        ctx.deps.emit('tool_end', tool=tool.__name__, chars=len(result),
+                      elapsed=round(time.monotonic() - started, 3))
+        return result
+    return wrapper
+
 @github_agent.tool
+@reports_progress
 async def get_repo_info(ctx: RunContext[GitHubDeps], github_url: str) -> str:
-    """Get repository information using GitHub API."""
+    """Get repository information using GitHub API.
+
+    With a GitHub token this also lists the top-level entries and the start of
+    the README, all from one request.
+    """
     print(f"\nGitHub API Debug:")
     print(f"- URL: {github_url}")
     
@@ -108,7 +147,9 @@ async def get_repo_info(ctx: RunContext[GitHubDeps], github_url: str) -> str:
     print(f"- Owner: {owner}")
     print(f"- Repo: {repo}")
     
-    data = await ctx.deps.get_repo_data(owner, repo)
+    # One GraphQL query covers metadata, top-level entries and the README
+    overview = await ctx.deps.get_repo_overview(owner, repo)
+    data = overview['repo'] if overview else await ctx.deps.get_repo_data(owner, repo)
     if not data:
         return (
             "I'm unable to access the GitHub repository information at the moment. "
@@ -117,7 +158,7 @@ async def get_repo_info(ctx: RunContext[GitHubDeps], github_url: str) -> str:
         )
     
     size_mb = data['size'] / 1024
-    return (
+    info = (
         f"Repository: {data['full_name']}\n"
         f"Description: {data['description']}\n"
         f"Size: {size_mb:.1f}MB\n"
@@ -126,51 +167,152 @@ async def get_repo_info(ctx: RunContext[GitHubDeps], github_url: str) -> str:
         f"Created: {data['created_at']}\n"
         f"Last Updated: {data['updated_at']}"
     )
+    if not overview:
+        return info
+
+    if overview['ref']:
+        info += f"\nDefault Branch: {overview['ref']['branch']} ({overview['ref']['sha'][:7]})"
+    entries = sorted(overview['entries'], key=lambda e: (e['type'] != 'tree', e['path'].lower()))
+    if entries:
+        info += "\nTop-level: " + ", ".join(
+            f"{e['path']}/" if e['type'] == 'tree' else e['path'] for e in entries
+        )
+    readme = next((f for f in overview['files'] if f['text']), None)
+    if readme:
+        text = readme['text']
+        excerpt = text[:README_EXCERPT_CHARS]
+        if len(text) > len(excerpt):
+            excerpt += f"\n… ({len(text) - len(excerpt)} more characters, use get_file_content for the rest)"
+        info += f"\n\n{readme['path']}:\n{excerpt}"
+    return info
 
 @github_agent.tool
-async def get_repo_structure(ctx: RunContext[GitHubDeps], github_url: str) -> str:
-    """Get the directory structure of a GitHub repository.
+@reports_progress
+async def get_repo_structure(
+    ctx: RunContext[GitHubDeps],
+    github_url: str,
+    path: str = "",
+    max_tokens: int = 2000,
+    max_depth: int = 4,
+    exclude: List[str] | None = None,
+) -> str:
+    """Get a ranked overview of the directory structure of a GitHub repository.
+
+    Output is bounded: the most relevant files (READMEs, manifests, entry points)
+    are listed first and large directories are collapsed with file counts. Use
+    get_directory_contents or find_files to drill into collapsed parts.
 
     Args:
         ctx: The context.
         github_url: The GitHub repository URL.
+        path: Directory to start from; empty for the repository root.
+        max_tokens: Approximate size budget for the output.
+        max_depth: Maximum directory depth to expand.
+        exclude: Extra gitignore-style patterns to hide, e.g. ["docs/", "*.svg"].
 
     Returns:
-        str: Directory structure as a formatted string.
+        str: Directory structure as an indented tree.
     """
     match = re.search(r'github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$', github_url)
     if not match:
         return "Invalid GitHub URL format"
     
     owner, repo = match.groups()
-    headers = {'Authorization': f'token {ctx.deps.github_token}'} if ctx.deps.github_token else {}
+    tree = None
+    async for tree in ctx.deps.iter_tree(owner, repo):
+        # Large repos are walked in parts; show streaming clients each one
+        if not tree.complete and ctx.deps.on_event is not None:
+            partial = render_structure(tree, path, max_tokens=max_tokens, max_depth=max_depth, excludes=exclude)
+            if partial is not None:
+                ctx.deps.emit('tool_progress', tool='get_repo_structure', files=len(tree), partial=partial)
+    if tree is None:
+        return "Failed to get repository structure: repository not found or not accessible"
     
-    response = await ctx.deps.client.get(
-        f'https://api.github.com/repos/{owner}/{repo}/git/trees/main?recursive=1',
-        headers=headers
-    )
+    structure = render_structure(tree, path, max_tokens=max_tokens, max_depth=max_depth, excludes=exclude)
+    if structure is None:
+        return f"Directory not found: {path}"
+    if not tree.complete:
+        structure += "\n(Partial listing: some directories could not be fetched)"
     
-    if response.status_code != 200:
-        # Try with master branch if main fails
-        response = await ctx.deps.client.get(
-            f'https://api.github.com/repos/{owner}/{repo}/git/trees/master?recursive=1',
-            headers=headers
-        )
-        if response.status_code != 200:
-            return f"Failed to get repository structure: {response.text}"
+    return structure
+
+def format_size(size: int) -> str:
+    """Human-readable byte size for tool output."""
+    for unit in ['B', 'KB', 'MB']:
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+@github_agent.tool
+@reports_progress
+async def get_directory_contents(ctx: RunContext[GitHubDeps], github_url: str, path: str = "") -> str:
+    """List the files and subdirectories directly inside one directory.
+
+    Args:
+        ctx: The context.
+        github_url: The GitHub repository URL.
+        path: Directory path within the repository; empty for the root.
+
+    Returns:
+        str: One line per entry with file counts for directories and sizes for files.
+    """
+    match = re.search(r'github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$', github_url)
+    if not match:
+        return "Invalid GitHub URL format"
     
-    data = response.json()
-    tree = data['tree']
+    owner, repo = match.groups()
+    tree = await ctx.deps.get_tree(owner, repo)
+    if tree is None:
+        return "Failed to get directory contents: repository not found or not accessible"
     
-    # Build directory structure
-    structure = []
-    for item in tree:
-        if not any(excluded in item['path'] for excluded in ['.git/', 'node_modules/', '__pycache__/']):
-            structure.append(f"{'📁 ' if item['type'] == 'tree' else '📄 '}{item['path']}")
+    children = tree.list_dir(path)
+    if children is None:
+        return f"Directory not found: {path}"
+    if not children:
+        return f"Directory is empty: {path or '/'}"
     
-    return "\n".join(structure)
+    lines = []
+    for child in children:
+        if child['type'] == 'tree':
+            lines.append(f"📁 {child['path']}/ ({child['files']} files, {format_size(child['size'])})")
+        else:
+            lines.append(f"📄 {child['path']} ({format_size(child['size'])})")
+    return "\n".join(lines)
 
 @github_agent.tool
+@reports_progress
+async def find_files(ctx: RunContext[GitHubDeps], github_url: str, pattern: str, limit: int = 200) -> str:
+    """Find files in the repository whose paths match a glob pattern.
+
+    Args:
+        ctx: The context.
+        github_url: The GitHub repository URL.
+        pattern: Glob such as "*.md", "src/**/*.py" or "docs/*". A pattern without "/" matches file names at any depth.
+        limit: Maximum number of paths to return.
+
+    Returns:
+        str: Matching paths, one per line.
+    """
+    match = re.search(r'github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$', github_url)
+    if not match:
+        return "Invalid GitHub URL format"
+    
+    owner, repo = match.groups()
+    tree = await ctx.deps.get_tree(owner, repo)
+    if tree is None:
+        return "Failed to find files: repository not found or not accessible"
+    
+    paths = [p for p in tree.glob(pattern) if tree.lookup(p)['type'] == 'blob']
+    if not paths:
+        return f"No files match {pattern}"
+    result = "\n".join(paths[:limit])
+    if len(paths) > limit:
+        result += f"\n... and {len(paths) - limit} more"
+    return result
+
+@github_agent.tool
+@reports_progress
 async def get_file_content(ctx: RunContext[GitHubDeps], github_url: str, file_path: str) -> str:
     """Get the content of a specific file from the GitHub repository.
 
@@ -187,20 +329,219 @@ async def get_file_content(ctx: RunContext[GitHubDeps], github_url: str, file_pa
         return "Invalid GitHub URL format"
     
     owner, repo = match.groups()
-    headers = {'Authorization': f'token {ctx.deps.github_token}'} if ctx.deps.github_token else {}
+    data = await ctx.deps.get_file_bytes(owner, repo, file_path)
+    if data is None:
+        return f"Failed to get file content: {file_path} not found or not accessible"
+    
+    return data.decode('utf-8', errors='replace')
+
+@github_agent.tool
+@reports_progress
+async def get_files(
+    ctx: RunContext[GitHubDeps],
+    github_url: str,
+    paths: List[str] | None = None,
+    pattern: str | None = None,
+    max_bytes: int = 60000,
+    max_files: int = 50,
+) -> str:
+    """Read several files from the GitHub repository in one call.
+
+    Prefer this over repeated get_file_content calls when you need more than one file.
+
+    Args:
+        ctx: The context.
+        github_url: The GitHub repository URL.
+        paths: File paths within the repository.
+        pattern: Glob selecting files instead of (or in addition to) paths, e.g. "src/pkg/*.py".
+        max_bytes: Total size budget for the returned file contents. Files that don't fit are listed, not read.
+        max_files: Maximum number of files to read.
+
+    Returns:
+        str: Each file's content under a "=== path ===" header, followed by any files left out.
+    """
+    match = re.search(r'github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$', github_url)
+    if not match:
+        return "Invalid GitHub URL format"
+    if not paths and not pattern:
+        return "Provide a list of paths or a glob pattern"
+    if max_bytes <= 0 or max_files <= 0:
+        return "max_bytes and max_files must be positive"
+    
+    owner, repo = match.groups()
+    tree = await ctx.deps.get_tree(owner, repo)
+    if tree is None:
+        return "Failed to get files: repository not found or not accessible"
+    
+    requested = [p.strip('/') for p in (paths or [])]
+    if pattern:
+        requested += [p for p in tree.glob(pattern) if tree.lookup(p)['type'] == 'blob']
+    requested = list(dict.fromkeys(requested))
+    
+    # Pick files up front from their tree sizes so nothing past the budget is downloaded
+    selected, missing, omitted = [], [], []
+    budget = max_bytes
+    for path in requested:
+        item = tree.lookup(path)
+        if item is None or item['type'] != 'blob':
+            missing.append(path)
+        elif len(selected) >= max_files or (item['size'] > budget and len(requested) > 1):
+            omitted.append(path)
+        else:
+            # A lone file is read even if it is too big, then truncated below
+            selected.append(path)
+            budget -= item['size']
+    
+    contents = await ctx.deps.get_files(owner, repo, selected)
     
-    response = await ctx.deps.client.get(
-        f'https://raw.githubusercontent.com/{owner}/{repo}/main/{file_path}',
-        headers=headers
+    sections = []
+    remaining = max_bytes
+    for path in selected:
+        data = contents[path]
+        if data is None:
+            missing.append(path)
+            continue
+        if b'\0' in data[:8000]:
+            sections.append(f"=== {path} ===\n(binary file, {format_size(len(data))}, skipped)")
+            continue
+        text = data.decode('utf-8', errors='replace')
+        if len(text) > remaining:
+            text = text[:max(remaining, 0)] + f"\n... (truncated, {format_size(len(data))} total)"
+        remaining -= len(text)
+        sections.append(f"=== {path} ===\n{text}")
+    
+    if omitted:
+        sections.append("Not included (over budget): " + ", ".join(omitted))
+    if missing:
+        sections.append("Not found: " + ", ".join(missing))
+    return "\n\n".join(sections)
+
+@github_agent.tool
+@reports_progress
+async def search_code(
+    ctx: RunContext[GitHubDeps],
+    github_url: str,
+    query: str,
+    regex: bool = False,
+    path_pattern: str | None = None,
+    max_results: int = 50,
+) -> str:
+    """Search the contents of every text file in the repository.
+
+    Use this to find where something is defined or used instead of reading files one by one.
+
+    Args:
+        ctx: The context.
+        github_url: The GitHub repository URL.
+        query: Text to look for (case-insensitive), or a Python regular expression if regex is true.
+        regex: Treat query as a regular expression.
+        path_pattern: Optional glob limiting which files are searched, e.g. "*.py" or "src/**".
+        max_results: Maximum number of matching lines to return.
+
+    Returns:
+        str: Matching lines as "path:line: text".
+    """
+    match = re.search(r'github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$', github_url)
+    if not match:
+        return "Invalid GitHub URL format"
+    if regex:
+        try:
+            re.compile(query)
+        except re.error as e:
+            return f"Invalid regular expression: {str(e)}"
+    
+    owner, repo = match.groups()
+    found = await ctx.deps.search_code(
+        owner, repo, query, regex=regex, path_pattern=path_pattern, max_results=max_results
     )
+    if found is None:
+        return "Failed to search code: repository not found or not accessible"
     
-    if response.status_code != 200:
-        # Try with master branch if main fails
-        response = await ctx.deps.client.get(
-            f'https://raw.githubusercontent.com/{owner}/{repo}/master/{file_path}',
-            headers=headers
-        )
-        if response.status_code != 200:
-            return f"Failed to get file content: {response.text}"
+    index, hits, total = found
+    lines = [f"{path}:{number}: {text}" for path, number, text in hits]
+    if not lines:
+        lines.append(f"No matches for {query}")
+    if total > len(hits):
+        lines.append(f"... and {total - len(hits)} more matches")
+    if index.skipped:
+        lines.append(f"(only {len(index)} files were searched; {index.skipped} more were not indexed)")
+    return "\n".join(lines)
+
+@github_agent.tool
+@reports_progress
+async def find_symbol(
+    ctx: RunContext[GitHubDeps],
+    github_url: str,
+    name: str,
+    kind: str | None = None,
+    max_results: int = 30,
+) -> str:
+    """Find where functions, classes, methods or constants are defined in the repository.
+
+    Returns signatures and locations, so the file usually doesn't need to be read.
+
+    Args:
+        ctx: The context.
+        github_url: The GitHub repository URL.
+        name: Symbol name, e.g. "GitHubDeps" or "GitHubDeps.get_tree". Partial names also match.
+        kind: Optional filter: class, function, method, field, constant, import, interface, type or enum.
+        max_results: Maximum number of symbols to return.
+
+    Returns:
+        str: Matching symbols as "path:line: signature".
+    """
+    match = re.search(r'github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$', github_url)
+    if not match:
+        return "Invalid GitHub URL format"
+    
+    owner, repo = match.groups()
+    table = await ctx.deps.get_symbol_table(owner, repo)
+    if table is None:
+        return "Failed to find symbol: repository not found or not accessible"
+    
+    found = table.find(name, kind)
+    lines = [format_symbol(symbol, path) for path, symbol in found[:max_results]]
+    if not lines:
+        lines.append(f"No symbols match {name}")
+    if len(found) > max_results:
+        lines.append(f"... and {len(found) - max_results} more")
+    if table.skipped:
+        lines.append(f"(only {len(table.files)} files were indexed; {table.skipped} more were not)")
+    return "\n".join(lines)
+
+@github_agent.tool
+@reports_progress
+async def outline_file(ctx: RunContext[GitHubDeps], github_url: str, file_path: str) -> str:
+    """List the imports, classes, functions and methods of a file with their signatures.
+
+    Much shorter than the file itself; use get_file_content only for the parts you need.
+
+    Args:
+        ctx: The context.
+        github_url: The GitHub repository URL.
+        file_path: Path to the file within the repository.
+
+    Returns:
+        str: One "line: signature" entry per symbol, with class members indented.
+    """
+    match = re.search(r'github\.com[:/]([^/]+)/([^/]+?)(?:\.git)?$', github_url)
+    if not match:
+        return "Invalid GitHub URL format"
+    if not language_for(file_path):
+        return f"Outlines aren't supported for {file_path}; use get_file_content instead"
+    
+    owner, repo = match.groups()
+    symbols = await ctx.deps.get_file_symbols(owner, repo, file_path)
+    if symbols is None:
+        return f"Failed to outline file: {file_path} not found or not accessible"
+    if not symbols:
+        return f"No symbols found in {file_path}"
     
-    return response.text
\ No newline at end of file
+    lines = []
+    for symbol in symbols:
+        # A multi-name import is one statement; show it once
+        if symbol.kind == 'import' and lines and lines[-1] == format_symbol(symbol):
+            continue
+        depth = symbol.parent.count('.') + 1 if symbol.parent else 0
+        lines.append("    " * depth + format_symbol(symbol))
+    return "\n".join(lines)
@@ -2,19 +2,22 @@ from typing import List, Optional, Dict, Any
 from fastapi import FastAPI, HTTPException, Security, Depends
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
-from supabase import create_client, Client
+from fastapi.responses import StreamingResponse
+from supabase import acreate_client, AsyncClient
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from pathlib import Path
-import httpx
+from contextlib import asynccontextmanager
 import sys
 import os
 from datetime import datetime
 import time
 import asyncio
+import json
 import logfire
 
 from pydantic_ai.messages import (
+    ModelMessage,
     ModelRequest,
     ModelResponse,
     UserPromptPart,
@@ -22,6 +25,11 @@ from pydantic_ai.messages import (
 )
 
 from github_deps import GitHubDeps
+from http_client import create_http_client
+from history_manager import compact_history
+from message_codec import encode_messages, decode_messages
+from message_writer import MessageWriter, merge_pending
+from session_history import SessionHistoryCache
 from github_agent import github_agent, initialize_agent
 from pydantic_ai.models.openai import OpenAIModel
 
@@ -39,8 +47,34 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 print(f"Initializing with Supabase URL: {SUPABASE_URL}")
 print(f"Service key starts with: {SUPABASE_KEY[:20]}...")
 
+# History is read by row count, then trimmed to a prompt token budget
+HISTORY_MAX_ROWS = int(os.getenv("HISTORY_MAX_ROWS", "50"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "8000"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Share one pooled GitHub HTTP client, one async Supabase client and one
+    message writer across all requests"""
+    global supabase, message_writer
+    app.state.http_client = create_http_client()
+    supabase = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    message_writer = MessageWriter(
+        supabase,
+        batch_size=int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("MESSAGE_WRITE_FLUSH_INTERVAL", "0.5")),
+        max_pending=int(os.getenv("MESSAGE_WRITE_MAX_PENDING", "10000")),
+    )
+    message_writer.start()
+    try:
+        yield
+    finally:
+        # Flush queued messages while the Supabase client is still open
+        await message_writer.close()
+        await app.state.http_client.aclose()
+        await supabase.postgrest.aclose()
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 security = HTTPBearer()
 
 app.add_middleware(
@@ -51,8 +85,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Async Supabase client, created in lifespan. The sync client would block the
+# event loop for a full round-trip on every query.
+supabase: AsyncClient | None = None
+# Batches message inserts in the background, created in lifespan
+message_writer: MessageWriter | None = None
+# Recent history per session, so follow-up turns skip the history query
+history_cache = SessionHistoryCache(
+    max_sessions=int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "1000")),
+    idle_ttl=float(os.getenv("SESSION_CACHE_IDLE_TTL", "1800")),
+    max_rows=HISTORY_MAX_ROWS,
+)
 
 # Configure logfire to suppress warnings
 logfire.configure(send_to_logfire='never')
@@ -86,10 +129,13 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
         )
     return True    
 
-async def fetch_conversation_history(session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+async def fetch_conversation_history(session_id: str, limit: int = HISTORY_MAX_ROWS) -> List[Dict[str, Any]]:
     """Fetch the most recent conversation history for a session."""
+    cached = history_cache.get(session_id, limit)
+    if cached is not None:
+        return cached
     try:
-        response = supabase.table("messages") \
+        response = await supabase.table("messages") \
             .select("*") \
             .eq("session_id", session_id) \
             .order("created_at", desc=True) \
@@ -98,12 +144,19 @@ async def fetch_conversation_history(session_id: str, limit: int = 10) -> List[D
         
         # Convert to list and reverse to get chronological order
         messages = response.data[::-1]
+        # Add messages this worker has queued but not yet written
+        messages = merge_pending(messages, message_writer.pending_for(session_id), limit)
+        history_cache.put(session_id, messages, complete=len(response.data) < limit)
         return messages
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch conversation history: {str(e)}")
 
 async def store_message(session_id: str, message_type: str, content: str, data: Optional[Dict] = None):
-    """Store a message in the Supabase messages table."""
+    """Queue a message for the Supabase messages table.
+
+    The insert happens in the background writer, so this returns immediately
+    and a database outage doesn't fail the request.
+    """
     message_obj = {
         "type": message_type,
         "content": content
@@ -111,13 +164,60 @@ async def store_message(session_id: str, message_type: str, content: str, data:
     if data:
         message_obj["data"] = data
 
+    row = {
+        "session_id": session_id,
+        "message": message_obj
+    }
+    await message_writer.write(row)
+    history_cache.append(session_id, row)
+
+def to_model_messages(conversation_history: List[Dict[str, Any]]) -> List[ModelMessage]:
+    """Convert stored messages into pydantic-ai message history.
+
+    AI rows that carry the run's full messages (tool calls and results
+    included) are restored as-is, replacing the human row for the same turn
+    since those messages already start with the user prompt. Older rows
+    without them fall back to plain prompt/text parts.
+    """
+    messages = []
+    previous_human = False
+    for msg in conversation_history:
+        msg_data = msg["message"]
+        msg_type = msg_data["type"]
+        msg_content = msg_data["content"]
+        full = decode_messages(msg_data.get("data")) if msg_type == "ai" else None
+        if full:
+            if previous_human:
+                messages.pop()
+            messages.extend(full)
+        elif msg_type == "human":
+            messages.append(ModelRequest(parts=[UserPromptPart(content=msg_content)]))
+        else:
+            messages.append(ModelResponse(parts=[TextPart(content=msg_content)]))
+        previous_human = msg_type == "human" and not full
+    return messages
+
+def create_deps(**kwargs) -> GitHubDeps:
+    """Agent dependencies sharing the process-wide HTTP client."""
+    return GitHubDeps(
+        client=app.state.http_client,
+        github_token=os.getenv('GITHUB_TOKEN'),  # Direct token usage like CLI
+        model=github_agent.model,
+        snapshot_mode=os.getenv('GITHUB_SNAPSHOT_MODE', '').lower() == 'true',
+        git_mirrors=os.getenv('GITHUB_GIT_MIRRORS', '').lower() == 'true',
+        **kwargs
+    )
+
+async def finish_write(task: asyncio.Task, what: str):
+    """Wait for a background Supabase write, logging rather than raising on failure."""
     try:
-        supabase.table("messages").insert({
-            "session_id": session_id,
-            "message": message_obj
-        }).execute()
+        await task
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to store message: {str(e)}")
+        print(f"Error storing {what}: {str(e)}")
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @app.post("/api/pydantic-github-agent", response_model=AgentResponse)
 async def github_agent_endpoint(request: AgentRequest):
@@ -128,66 +228,73 @@ async def github_agent_endpoint(request: AgentRequest):
         print(f"Query: {request.query}")
         print(f"Session ID: {request.session_id}")
         
-        # Initialize agent if not already initialized
-        if github_agent is None:
-            print("\nInitializing agent...")
-            initialize_agent()
-            print("Agent initialization complete")
-        
-        # Fetch conversation history
+        # Start the history read now so it overlaps with agent and deps setup
         print("\nFetching conversation history...")
-        conversation_history = await fetch_conversation_history(request.session_id)
+        history_task = asyncio.create_task(fetch_conversation_history(request.session_id))
+        # Let the query go out before the (synchronous) setup below runs
+        await asyncio.sleep(0)
+
+        try:
+            # Initialize agent if not already initialized
+            if github_agent is None:
+                print("\nInitializing agent...")
+                initialize_agent()
+                print("Agent initialization complete")
+
+            # Initialize agent dependencies
+            print("\nInitializing agent dependencies...")
+            deps = create_deps()
+        except Exception:
+            history_task.cancel()
+            raise
+
+        conversation_history = await history_task
         print(f"Found {len(conversation_history)} previous messages")
         
         # Convert conversation history
         print("\nConverting conversation history...")
-        messages = []
-        for msg in conversation_history:
-            msg_data = msg["message"]
-            msg_type = msg_data["type"]
-            msg_content = msg_data["content"]
-            msg = ModelRequest(parts=[UserPromptPart(content=msg_content)]) if msg_type == "human" else ModelResponse(parts=[TextPart(content=msg_content)])
-            messages.append(msg)
-
-        # Store user's query
+        messages = compact_history(to_model_messages(conversation_history), max_tokens=HISTORY_MAX_TOKENS)
+
+        # Store user's query while the agent runs instead of before it; the
+        # history has already been read so the new row can't leak into it
         print("\nStoring user query...")
-        await store_message(
+        store_task = asyncio.create_task(store_message(
             session_id=request.session_id,
             message_type="human",
             content=request.query
-        )            
-
-        # Initialize agent dependencies
-        print("\nInitializing agent dependencies...")
-        async with httpx.AsyncClient() as client:
-            deps = GitHubDeps(
-                client=client,
-                github_token=os.getenv('GITHUB_TOKEN'),  # Direct token usage like CLI
-                model=github_agent.model
-            )
+        ))
 
-            try:
-                print("\nRunning GitHub agent...")
-                result = await github_agent.run(
-                    request.query,
-                    message_history=messages,
-                    deps=deps
-                )
-                response_text = result.data if hasattr(result, 'data') else str(result)
-                print(f"Success! Response: {response_text[:200]}...")
-                return {
-                    "success": True,
-                    "response": response_text,
-                    "elapsed_time": time.time() - start_time
-                }
-            except Exception as e:
-                print(f"\nError running agent: {str(e)}")
-                print(f"Error type: {type(e)}")
-                return {
-                    "success": False,
-                    "error": str(e),
-                    "error_type": str(type(e))
-                }
+        try:
+            print("\nRunning GitHub agent...")
+            result = await github_agent.run(
+                request.query,
+                message_history=messages,
+                deps=deps
+            )
+            response_text = result.data if hasattr(result, 'data') else str(result)
+            print(f"Success! Response: {response_text[:200]}...")
+            await finish_write(store_task, "user query")
+            # Keep the tool calls and results so follow-ups can reuse them
+            await store_message(
+                session_id=request.session_id,
+                message_type="ai",
+                content=response_text,
+                data=encode_messages(result.new_messages())
+            )
+            return {
+                "success": True,
+                "response": response_text,
+                "elapsed_time": time.time() - start_time
+            }
+        except Exception as e:
+            print(f"\nError running agent: {str(e)}")
+            print(f"Error type: {type(e)}")
+            await finish_write(store_task, "user query")
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": str(type(e))
+            }
 
     except Exception as e:
         print(f"Error in endpoint: {str(e)}")
@@ -196,6 +303,96 @@ async def github_agent_endpoint(request: AgentRequest):
             "error": str(e)
         }
 
+@app.post("/api/pydantic-github-agent/stream")
+async def github_agent_stream_endpoint(request: AgentRequest):
+    """Streaming variant of the agent endpoint using Server-Sent Events.
+
+    Events: `start` immediately, `tool_start`/`tool_end` as tools run (with
+    `tool_progress` partial listings while a large tree is walked), `token`
+    for each chunk of the answer, then `done` (after the answer is stored in
+    Supabase) or `error`.
+    """
+    async def event_stream():
+        start_time = time.time()
+        yield sse_event("start", {"request_id": request.request_id, "session_id": request.session_id})
+
+        # Tool progress and tokens both arrive through this queue; None ends the run
+        events: asyncio.Queue = asyncio.Queue()
+        history_task = asyncio.create_task(fetch_conversation_history(request.session_id))
+        await asyncio.sleep(0)
+        try:
+            if github_agent is None:
+                initialize_agent()
+            deps = create_deps(on_event=lambda event, data: events.put_nowait((event, data)))
+            messages = compact_history(to_model_messages(await history_task), max_tokens=HISTORY_MAX_TOKENS)
+        except Exception as e:
+            history_task.cancel()
+            print(f"Error preparing stream: {str(e)}")
+            yield sse_event("error", {"error": str(e), "error_type": str(type(e))})
+            return
+
+        store_task = asyncio.create_task(store_message(
+            session_id=request.session_id,
+            message_type="human",
+            content=request.query
+        ))
+
+        run_messages: List[ModelMessage] = []
+
+        async def run_agent():
+            try:
+                async with github_agent.run_stream(
+                    request.query,
+                    message_history=messages,
+                    deps=deps
+                ) as result:
+                    chunks = []
+                    async for delta in result.stream_text(delta=True):
+                        chunks.append(delta)
+                        events.put_nowait(("token", {"text": delta}))
+                    run_messages.extend(result.new_messages())
+                    # Delta streaming doesn't record the final response itself
+                    if not result.is_complete:
+                        run_messages.append(ModelResponse.from_text("".join(chunks)))
+            finally:
+                events.put_nowait(None)
+
+        task = asyncio.create_task(run_agent())
+        chunks = []
+        try:
+            while (item := await events.get()) is not None:
+                event, data = item
+                if event == "token":
+                    chunks.append(data["text"])
+                yield sse_event(event, data)
+            await task
+        except Exception as e:
+            print(f"\nError running agent stream: {str(e)}")
+            yield sse_event("error", {"error": str(e), "error_type": str(type(e))})
+            return
+        finally:
+            # Client disconnected or the run failed; don't leave the agent running
+            if not task.done():
+                task.cancel()
+            # The query is kept even if the run fails, same as before
+            await finish_write(store_task, "user query")
+
+        # Queued after the query row so the two stay in order
+        response_text = "".join(chunks)
+        await store_message(
+            session_id=request.session_id,
+            message_type="ai",
+            content=response_text,
+            data=encode_messages(run_messages) if run_messages else None
+        )
+        yield sse_event("done", {"elapsed_time": time.time() - start_time})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/")
 async def health_check():
     return {"status": "ok", "supabase": "connected"}
@@ -204,7 +401,7 @@ async def health_check():
 async def api_health():
     try:
         # Test Supabase connection
-        response = supabase.table("messages").select("count").execute()
+        response = await supabase.table("messages").select("count").execute()
         return {
             "status": "ok",
             "supabase": "connected",
@@ -0,0 +1,234 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict
+
+# Only refresh an entry's LRU timestamp when it is older than this, so hot
+# keys don't turn every read into a write.
+ACCESS_RESOLUTION = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (id, total_bytes) VALUES (0, 0);
+"""
+
+SCHEMA_VERSION = 2
+
+
+@dataclass
+class CacheEntry:
+    """A cached value plus the validators needed to revalidate it"""
+    value: Any
+    etag: str | None = None
+    last_modified: str | None = None
+    expires_at: float | None = None
+
+    def is_fresh(self) -> bool:
+        """Entries without an expiry never go stale"""
+        return self.expires_at is None or self.expires_at > time.time()
+
+
+class GitHubCache:
+    """Persistent key/value cache backed by SQLite in WAL mode.
+
+    Reads and writes are single-row lookups on the primary key. Total size is
+    capped at ``max_bytes`` by evicting the least recently used entries. WAL
+    mode plus a busy timeout lets several uvicorn workers share one file.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path,
+            timeout=30.0,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Bring databases created by older versions up to SCHEMA_VERSION"""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        if 'expires_at' not in columns:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN etag TEXT")
+            self._conn.execute("ALTER TABLE entries ADD COLUMN last_modified TEXT")
+            self._conn.execute("ALTER TABLE entries ADD COLUMN expires_at REAL")
+            # Version 1 entries were cached forever; make them revalidate.
+            self._conn.execute("UPDATE entries SET expires_at = 0")
+        self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def get(self, key: str) -> Any:
+        """Return the cached value for ``key`` or None, ignoring expiry"""
+        entry = self.get_entry(key)
+        return entry.value if entry else None
+
+    def get_entry(self, key: str) -> CacheEntry | None:
+        """Return the cached value for ``key`` with its validators"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, accessed_at, etag, last_modified, expires_at "
+                "FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > ACCESS_RESOLUTION:
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+        return CacheEntry(
+            value=json.loads(row[0]),
+            etag=row[2],
+            last_modified=row[3],
+            expires_at=row[4],
+        )
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: float | None = None,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        """Insert or replace ``key`` and evict LRU entries over the size cap.
+
+        ``ttl`` is in seconds; None means the entry never expires.
+        """
+        expires_at = time.time() + ttl if ttl is not None else None
+        payload = json.dumps(value)
+        size = len(key) + len(payload)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT size FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                old_size = row[0] if row else 0
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(key, value, size, accessed_at, etag, last_modified, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, payload, size, time.time(), etag, last_modified, expires_at),
+                )
+                self._conn.execute(
+                    "UPDATE stats SET total_bytes = total_bytes + ? WHERE id = 0",
+                    (size - old_size,),
+                )
+                self._evict(protect=key)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def touch(self, key: str, ttl: float | None):
+        """Extend the expiry of ``key`` after a successful revalidation"""
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET expires_at = ?, accessed_at = ? WHERE key = ?",
+                (expires_at, now, key),
+            )
+
+    def delete(self, key: str):
+        """Remove ``key`` from the cache if present"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT size FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.execute(
+                        "UPDATE stats SET total_bytes = total_bytes - ? WHERE id = 0",
+                        (row[0],),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT total_bytes FROM stats WHERE id = 0"
+            ).fetchone()[0]
+
+    def _evict(self, protect: str):
+        """Drop oldest entries until under max_bytes. Caller holds the transaction."""
+        total = self._conn.execute(
+            "SELECT total_bytes FROM stats WHERE id = 0"
+        ).fetchone()[0]
+        while total > self.max_bytes:
+            victims = self._conn.execute(
+                "SELECT key, size FROM entries WHERE key != ? "
+                "ORDER BY accessed_at LIMIT 64",
+                (protect,),
+            ).fetchall()
+            if not victims:
+                break
+            for victim_key, victim_size in victims:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (victim_key,))
+                total -= victim_size
+                if total <= self.max_bytes:
+                    break
+        self._conn.execute("UPDATE stats SET total_bytes = ? WHERE id = 0", (total,))
+
+    def import_json(self, json_file: str):
+        """One-off import of the legacy whole-file JSON cache"""
+        try:
+            with open(json_file, 'r') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            print(f"Error importing legacy cache: {e}")
+            return
+        for key, value in legacy.items():
+            if self.get(key) is None:
+                # Legacy entries have no validators, so refetch them on first use
+                self.set(key, value, ttl=0)
+
+
+# One open cache per file per process; GitHubDeps is created per request.
+_caches: Dict[str, GitHubCache] = {}
+_caches_lock = threading.Lock()
+
+
+def open_cache(path: str, max_bytes: int = 64 * 1024 * 1024) -> GitHubCache:
+    """Return the process-wide cache for ``path``, opening it on first use"""
+    key = str(Path(path).resolve())
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            is_new = not Path(path).exists()
+            cache = GitHubCache(path, max_bytes=max_bytes)
+            legacy = Path(path).with_suffix('.json')
+            if is_new and legacy.exists():
+                cache.import_json(str(legacy))
+            _caches[key] = cache
+        return cache
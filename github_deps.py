@@ -1,61 +1,255 @@
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
 import httpx
 from pydantic_ai.models.openai import OpenAIModel
-from typing import Dict, Any
-import json
-from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Any, List, Tuple
+import asyncio
 import os
+import re
+from pathlib import Path
+
+from blob_store import BlobStore, git_blob_sha, open_blob_store
+from code_search import TrigramIndex, decode_text, indexable_files
+from github_cache import CacheEntry, GitHubCache, open_cache
+from git_mirror import GitError, GitMirrorPool, open_mirror_pool
+from github_graphql import GRAPHQL_URL, README_CANDIDATES, build_overview_query, parse_overview
+from rate_limit import PRIORITY_HIGH, PRIORITY_LOW, RateLimitExceeded, TokenPool, open_token_pool
+from repo_tree import RepoTree
+from single_flight import SingleFlight
+from symbols import SYMBOLS_VERSION, Symbol, SymbolTable, extract_symbols, language_for
+from snapshot import SnapshotError, download_snapshot
+
+# Seconds before a cached resource is revalidated, keyed by resource kind.
+DEFAULT_CACHE_TTLS: Dict[str, float] = {
+    'repo': 300,
+    # How long a resolved default-branch SHA is reused by new sessions
+    'ref': 60,
+    # How long a repo that returned 401/403/404 is reported missing without asking again
+    'missing': 60,
+    # Only used when a ref couldn't be pinned to a SHA; SHA trees never change
+    'tree': 300,
+}
+
+# The compare API lists at most this many changed files
+MAX_COMPARE_FILES = 300
+
+# Parsed tree indexes shared by every GitHubDeps in the process, keyed by
+# (owner, repo, sha) and bounded LRU (max_tree_indexes).
+_tree_indexes: "OrderedDict[Tuple[str, str, str], RepoTree]" = OrderedDict()
+# Queues of iter_tree callers following a tree build, keyed like the indexes
+_tree_watchers: Dict[Tuple[str, str, str], set] = {}
+# The tree a build in progress has published so far, for callers joining it
+_partial_trees: Dict[Tuple[str, str, str], RepoTree] = {}
+
+# Code search indexes, keyed and bounded the same way; they are also saved
+# under the blob directory so they survive restarts. Only the newest few per
+# repo are kept on disk: the current commit and the one it is patched from.
+SEARCH_INDEXES_PER_REPO = 2
+# Fetching more than this many files one by one costs more than downloading
+# the commit's tarball once
+SNAPSHOT_FILL_MIN_FILES = 50
+_search_indexes: "OrderedDict[Tuple[str, str, str], TrigramIndex]" = OrderedDict()
+# Symbol tables per commit; the per-file tables they are built from are
+# cached by blob SHA, so a new commit only re-parses files that changed.
+_symbol_tables: "OrderedDict[Tuple[str, str, str], SymbolTable]" = OrderedDict()
+
+# Concurrent requests for the same repo data, ref, tree or blob share one
+# upstream call, across every GitHubDeps in the process.
+_inflight = SingleFlight()
+
+# Which credential works for each (owner, repo): True for the token pool,
+# False for anonymous access (e.g. an org whose SSO rejects the token).
+_repo_auth: Dict[Tuple[str, str], bool] = {}
+
+
+class TreeWalkError(Exception):
+    """A tree listing request failed while walking a repository"""
 
 @dataclass
 class GitHubDeps:
     client: httpx.AsyncClient
     github_token: str | None = None
     model: OpenAIModel | None = None
-    _cache_file: str = ".github_cache.json"
-    _cache: Dict[str, Any] = None
+    # Extra tokens to spread API calls over, alongside github_token
+    github_tokens: List[str] = field(
+        default_factory=lambda: [t.strip() for t in os.getenv('GITHUB_TOKENS', '').split(',') if t.strip()]
+    )
+    _token_pool: TokenPool = None
+    # Never fall back to anonymous requests, even if a token is rejected
+    always_authenticate: bool = field(default_factory=lambda: os.getenv('GITHUB_ALWAYS_AUTH', '').lower() == 'true')
+    _cache_file: str = ".github_cache.db"
+    _cache_max_bytes: int = field(default_factory=lambda: int(os.getenv('GITHUB_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+    _cache: GitHubCache = None
+    cache_ttls: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_CACHE_TTLS))
+    _refs: Dict[str, Dict[str, str]] = None
+    _blob_dir: str = ".github_blobs"
+    _blob_memory_bytes: int = field(default_factory=lambda: int(os.getenv('GITHUB_BLOB_MEMORY_BYTES', 32 * 1024 * 1024)))
+    _blob_disk_bytes: int = field(default_factory=lambda: int(os.getenv('GITHUB_BLOB_DISK_BYTES', 512 * 1024 * 1024)))
+    _blobs: BlobStore = None
+    tree_walk_concurrency: int = 8
+    file_fetch_concurrency: int = 8
+    # Download the whole repo as one tarball and serve tree/file tools locally
+    snapshot_mode: bool = False
+    snapshot_max_file_bytes: int = 1024 * 1024
+    # Process-wide LRU bounds for parsed trees and search/symbol indexes
+    max_tree_indexes: int = field(default_factory=lambda: int(os.getenv('GITHUB_MAX_TREE_INDEXES', 32)))
+    max_search_indexes: int = field(default_factory=lambda: int(os.getenv('GITHUB_MAX_SEARCH_INDEXES', 8)))
+    # Most files fetched to build one repo's code search index or symbol table
+    search_max_files: int = field(default_factory=lambda: int(os.getenv('GITHUB_SEARCH_MAX_FILES', 5000)))
+    # Serve refs, trees and files from local partial clones instead of the API
+    git_mirrors: bool = False
+    _mirror_dir: str = ".github_mirrors"
+    _mirror_disk_bytes: int = field(default_factory=lambda: int(os.getenv('GITHUB_MIRROR_DISK_BYTES', 2 * 1024 * 1024 * 1024)))
+    _mirrors: GitMirrorPool = None
+    # Called as on_event(event, data) to report progress to streaming clients
+    on_event: Callable[[str, Dict[str, Any]], None] | None = None
 
     def __post_init__(self):
-        """Initialize cache from file if it exists"""
-        self._cache = {}
-        if Path(self._cache_file).exists():
-            try:
-                with open(self._cache_file, 'r') as f:
-                    self._cache = json.load(f)
-            except Exception as e:
-                print(f"Error loading cache: {e}")
+        """Attach to the process-wide persistent cache and token pool"""
+        self._cache = open_cache(self._cache_file, max_bytes=self._cache_max_bytes)
+        self._token_pool = open_token_pool([self.github_token, *self.github_tokens])
+        self._refs = {}
+        self._blobs = open_blob_store(
+            self._blob_dir,
+            max_memory_bytes=self._blob_memory_bytes,
+            max_disk_bytes=self._blob_disk_bytes,
+        )
+        if self.git_mirrors:
+            self._mirrors = open_mirror_pool(
+                self._mirror_dir,
+                max_disk_bytes=self._mirror_disk_bytes,
+                fetch_interval=self.cache_ttls.get('ref', 60),
+            )
 
-    def get_headers(self) -> dict:
+    def emit(self, event: str, **data):
+        """Report a progress event to the caller, if anyone is listening"""
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event, data)
+        except Exception as e:
+            print(f"Error reporting {event} event: {e}")
+
+    def get_headers(self, token: str | None = None) -> dict:
         """Get GitHub API headers with correct token format"""
         headers = {
             'Accept': 'application/vnd.github.v3+json',
             'User-Agent': 'GitHub-Agent'
         }
-        if self.github_token:
-            headers['Authorization'] = f'token {self.github_token}'
+        if token:
+            headers['Authorization'] = f'token {token}'
         return headers
 
+    def repo_auth(self, owner: str, repo: str) -> bool:
+        """Whether requests for this repo should use a token.
+
+        Tokens by default, since their quota is far larger; anonymous only
+        when there are none or an earlier lookup found the token rejected.
+        """
+        if not self._token_pool.tokens:
+            return False
+        if self.always_authenticate:
+            return True
+        return _repo_auth.get((owner, repo), True)
+
+    async def github_request(
+        self,
+        url: str,
+        method: str = 'GET',
+        headers: dict | None = None,
+        resource: str | None = 'core',
+        priority: int = PRIORITY_HIGH,
+        authenticated: bool | None = None,
+        max_attempts: int = 4,
+        **kwargs,
+    ) -> httpx.Response:
+        """Make a GitHub request with a token chosen by the rate-limit pool.
+
+        ``resource`` is the rate-limit bucket the call counts against, or None
+        for hosts without API quota (raw.githubusercontent.com). Rate-limited
+        responses are retried on another token, or after the reset or
+        Retry-After, up to ``max_attempts`` times. Raises RateLimitExceeded if
+        no token frees up within the pool's maximum wait.
+        """
+        for attempt in range(max_attempts):
+            state = await self._token_pool.acquire(resource, priority, authenticated)
+            response = None
+            try:
+                response = await self.client.request(
+                    method, url, headers={**self.get_headers(state.token), **(headers or {})}, **kwargs
+                )
+            finally:
+                limited = self._token_pool.release(state, resource, response)
+            if not limited:
+                break
+            print(f"Rate limited ({limited}) on {state.name} for {url}")
+        return response
+
     def get_from_cache(self, key: str) -> Any:
         """Get value from cache"""
-        return self._cache.get(key)
+        try:
+            return self._cache.get(key)
+        except Exception as e:
+            print(f"Error reading cache: {e}")
+            return None
 
-    def save_to_cache(self, key: str, value: Any):
-        """Save value to cache and persist to file"""
-        self._cache[key] = value
+    def get_cache_entry(self, key: str) -> CacheEntry | None:
+        """Get value from cache along with its ETag/Last-Modified and expiry"""
         try:
-            with open(self._cache_file, 'w') as f:
-                json.dump(self._cache, f)
+            return self._cache.get_entry(key)
+        except Exception as e:
+            print(f"Error reading cache: {e}")
+            return None
+
+    def save_to_cache(
+        self,
+        key: str,
+        value: Any,
+        ttl: float | None = None,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        """Save value to the persistent cache"""
+        try:
+            self._cache.set(key, value, ttl=ttl, etag=etag, last_modified=last_modified)
         except Exception as e:
             print(f"Error saving cache: {e}")
 
+    def refresh_cache(self, key: str, ttl: float | None):
+        """Mark a cached value as fresh again after a 304 Not Modified"""
+        try:
+            self._cache.touch(key, ttl)
+        except Exception as e:
+            print(f"Error saving cache: {e}")
+
+    @staticmethod
+    def conditional_headers(entry: CacheEntry | None) -> dict:
+        """Validators for revalidating a stale cache entry"""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
     async def get_repo_data(self, owner: str, repo: str) -> Dict[str, Any]:
-        """Get repository data with caching"""
+        """Get repository data with caching; concurrent callers share one request"""
+        return await _inflight.do(('repo', owner, repo), lambda: self._fetch_repo_data(owner, repo))
+
+    async def _fetch_repo_data(self, owner: str, repo: str) -> Dict[str, Any]:
         cache_key = f"repo_{owner}_{repo}"
-        
-        # Check cache first
-        cached = self.get_from_cache(cache_key)
-        if cached:
+        ttl = self.cache_ttls.get('repo')
+
+        # Check cache first; stale entries are revalidated below
+        cached = self.get_cache_entry(cache_key)
+        if cached and cached.is_fresh():
             print("Using cached repo data")
-            return cached
+            return cached.value
+        missing = self.get_cache_entry(f"missing_{owner}_{repo}")
+        if missing and missing.is_fresh():
+            print(f"Repo {owner}/{repo} recently returned {missing.value}, not retrying yet")
+            return cached.value if cached else None
 
         # Debug token
         print("\nGitHub Token Debug:")
@@ -64,38 +258,800 @@ class GitHubDeps:
             print(f"- Token starts with: {self.github_token[:10]}...")
             print(f"- Token length: {len(self.github_token)}")
 
-        # Make API call if not in cache
-        headers = self.get_headers()
+        # Make API call if not cached or stale, with the credential that
+        # worked for this repo last time
+        headers = self.conditional_headers(cached)
+        authenticated = self.repo_auth(owner, repo)
         api_url = f'https://api.github.com/repos/{owner}/{repo}'
         print(f"\nMaking GitHub API call:")
         print(f"- URL: {api_url}")
-        print(f"- Headers: {headers}")
+        print(f"- Authenticated: {'Yes' if authenticated else 'No'}")
         
         try:
-            # Try unauthenticated first for public repos
-            basic_headers = {
-                'Accept': 'application/vnd.github.v3+json',
-                'User-Agent': 'GitHub-Agent'
-            }
-            print("\nTrying unauthenticated request first...")
-            response = await self.client.get(api_url, headers=basic_headers)
+            response = await self.github_request(api_url, headers=headers, authenticated=authenticated)
             print(f"- Status: {response.status_code}")
-            
-            if response.status_code != 200 and self.github_token:
-                print("\nTrying with authentication...")
-                response = await self.client.get(api_url, headers=headers)
-                print(f"- Status: {response.status_code}")
+
+            if (
+                response.status_code in (401, 403, 404)
+                and self._token_pool.tokens
+                and not self.always_authenticate
+            ):
+                # The other credential may work: a token for private repos,
+                # anonymous for public repos of orgs that reject the token
+                print(f"\nRetrying {'without' if authenticated else 'with'} authentication...")
+                fallback = await self.github_request(api_url, headers=headers, authenticated=not authenticated)
+                print(f"- Status: {fallback.status_code}")
+                if fallback.status_code in (200, 304):
+                    response = fallback
+                    authenticated = not authenticated
+
+            if response.status_code in (200, 304):
+                _repo_auth[(owner, repo)] = authenticated
             
             print(f"- Response: {response.text[:200]}...")
             
-            if response.status_code == 200:
+            if response.status_code == 304 and cached:
+                print("Cached repo data not modified")
+                self.refresh_cache(cache_key, ttl)
+                return cached.value
+            elif response.status_code == 200:
                 data = response.json()
-                self.save_to_cache(cache_key, data)
+                self.save_to_cache(
+                    cache_key,
+                    data,
+                    ttl=ttl,
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                )
                 return data
             else:
                 print(f"Error response: {response.text}")
-                return None
+                if response.status_code in (401, 403, 404):
+                    # Both credentials were refused; don't pay two requests
+                    # on every lookup of a repo that doesn't exist
+                    self.save_to_cache(f"missing_{owner}_{repo}", response.status_code, ttl=self.cache_ttls.get('missing', 60))
+                return cached.value if cached else None
             
         except Exception as e:
             print(f"Exception during API call: {str(e)}")
-            return None 
\ No newline at end of file
+            # Serve stale data rather than nothing if GitHub is unreachable
+            return cached.value if cached else None
+
+    async def get_repo_overview(self, owner: str, repo: str) -> Dict[str, Any] | None:
+        """Repo metadata, pinned default-branch SHA, top-level entries and README in one call.
+
+        Uses a single GraphQL query instead of separate REST round-trips and
+        fills the resolved ref and the blob store. The REST repo entry is left
+        alone so its ETag keeps working for get_repo_data.
+        Needs a token (GraphQL has no anonymous access); returns None without
+        one or on failure, so callers can fall back to get_repo_data.
+        """
+        if not self.repo_auth(owner, repo):
+            return None
+        cache_key = f"overview_{owner}_{repo}"
+        cached = self.get_cache_entry(cache_key)
+        if cached and cached.is_fresh():
+            overview = cached.value
+        else:
+            overview = await _inflight.do(('overview', owner, repo), lambda: self._fetch_overview(owner, repo))
+            if overview is None:
+                return None
+        # The overview lives as long as repo data; its SHA is only pinned
+        # while the ref entry saved alongside it is within the ref TTL
+        ref = self.get_cache_entry(f"ref_{owner}_{repo}")
+        if overview['ref'] and ref and ref.is_fresh():
+            self._refs.setdefault(f"{owner}/{repo}", ref.value)
+        return overview
+
+    async def _fetch_overview(self, owner: str, repo: str) -> Dict[str, Any] | None:
+        try:
+            response = await self.github_request(
+                GRAPHQL_URL,
+                method='POST',
+                json={
+                    'query': build_overview_query(README_CANDIDATES),
+                    'variables': {'owner': owner, 'name': repo},
+                },
+                resource='graphql',
+                authenticated=True,
+            )
+        except Exception as e:
+            print(f"Exception during GraphQL call: {str(e)}")
+            return None
+        if response.status_code != 200:
+            print(f"GraphQL error for {owner}/{repo}: {response.status_code} {response.text[:200]}")
+            return None
+        body = response.json()
+        repository = (body.get('data') or {}).get('repository')
+        if not repository:
+            print(f"GraphQL error for {owner}/{repo}: {body.get('errors')}")
+            return None
+
+        overview = parse_overview(repository, README_CANDIDATES)
+        if overview['ref']:
+            self.save_to_cache(f"ref_{owner}_{repo}", overview['ref'], ttl=self.cache_ttls.get('ref'))
+        for file in overview['files']:
+            if file['text'] is None:
+                continue
+            data = file['text'].encode('utf-8')
+            # Only trust the inlined text if it round-trips to the blob SHA
+            if git_blob_sha(data) == file['sha']:
+                await self._blobs.aput(file['sha'], data)
+        self.save_to_cache(f"overview_{owner}_{repo}", overview, ttl=self.cache_ttls.get('repo'))
+        return overview
+
+    async def resolve_ref(self, owner: str, repo: str) -> Dict[str, str] | None:
+        """Resolve the default branch and pin its commit SHA for this session.
+
+        The branch name comes from the cached repo metadata, so only the SHA
+        lookup costs a request, and only once per repo per GitHubDeps.
+        Returns {'branch': ..., 'sha': ...} or None if the repo is unreachable.
+        """
+        key = f"{owner}/{repo}"
+        if key in self._refs:
+            return self._refs[key]
+        ref = await _inflight.do(('ref', owner, repo), lambda: self._fetch_ref(owner, repo))
+        if ref:
+            self._refs[key] = ref
+        return ref
+
+    async def _fetch_ref(self, owner: str, repo: str) -> Dict[str, str] | None:
+        if self.git_mirrors:
+            path = await self.mirror_path(owner, repo)
+            if path is not None:
+                try:
+                    return await self._mirrors.resolve_head(path)
+                except GitError as e:
+                    print(f"Error resolving HEAD of {owner}/{repo} mirror: {str(e)}")
+
+        # A SHA resolved by a recent session (or another worker) is reused
+        key = f"{owner}/{repo}"
+        cache_key = f"ref_{owner}_{repo}"
+        cached = self.get_cache_entry(cache_key)
+        if cached and cached.is_fresh():
+            return cached.value
+
+        data = await self.get_repo_data(owner, repo)
+        if not data:
+            return None
+        branch = data.get('default_branch') or 'main'
+
+        # Fall back to the branch name if the SHA can't be resolved; it is
+        # still a valid ref, just not pinned.
+        sha = branch
+        try:
+            response = await self.github_request(
+                f'https://api.github.com/repos/{owner}/{repo}/commits/{branch}',
+                headers={'Accept': 'application/vnd.github.sha'},
+                authenticated=self.repo_auth(owner, repo)
+            )
+            if response.status_code == 200:
+                sha = response.text.strip()
+                self.save_to_cache(
+                    cache_key,
+                    {'branch': branch, 'sha': sha},
+                    ttl=self.cache_ttls.get('ref'),
+                )
+            else:
+                print(f"Failed to resolve {branch} for {key}: {response.status_code}")
+        except Exception as e:
+            print(f"Exception resolving {branch} for {key}: {str(e)}")
+
+        return {'branch': branch, 'sha': sha}
+
+    async def get_tree(self, owner: str, repo: str) -> RepoTree | None:
+        """Get the indexed tree of the pinned default-branch commit.
+
+        The recursive tree is fetched once per (repo, SHA): later calls are
+        served from the in-process index or the persistent cache, and
+        concurrent calls wait for the same fetch.
+        """
+        ref = await self.resolve_ref(owner, repo)
+        if not ref:
+            return None
+        index_key = (owner, repo, ref['sha'])
+        tree = _tree_indexes.get(index_key)
+        if tree is not None:
+            _tree_indexes.move_to_end(index_key)
+            return tree
+        return await _inflight.do(('tree', *index_key), lambda: self._load_tree(owner, repo, ref))
+
+    async def _load_tree(self, owner: str, repo: str, ref: Dict[str, str]) -> RepoTree | None:
+        index_key = (owner, repo, ref['sha'])
+        tree = None
+        try:
+            async for tree in self._build_tree(owner, repo, ref):
+                _partial_trees[index_key] = tree
+                for queue in _tree_watchers.get(index_key, ()):
+                    queue.put_nowait(tree)
+        finally:
+            _partial_trees.pop(index_key, None)
+        return tree
+
+    async def iter_tree(self, owner: str, repo: str) -> AsyncIterator[RepoTree]:
+        """Yield the tree index as it is built, ending with the complete tree.
+
+        Small repos yield once. When GitHub truncates the recursive listing,
+        subtrees are walked in parallel and the same growing RepoTree (with
+        ``complete`` False) is yielded after each one is merged, so callers
+        can show partial results. The build is shared with get_tree and
+        other iter_tree callers; joining one midway first yields the tree
+        built so far.
+        """
+        ref = await self.resolve_ref(owner, repo)
+        if not ref:
+            return
+        index_key = (owner, repo, ref['sha'])
+        tree = _tree_indexes.get(index_key)
+        if tree is not None:
+            _tree_indexes.move_to_end(index_key)
+            yield tree
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        watchers = _tree_watchers.setdefault(index_key, set())
+        watchers.add(queue)
+        try:
+            task = _inflight.start(('tree', *index_key), lambda: self._load_tree(owner, repo, ref))
+            partial = _partial_trees.get(index_key)
+            if partial is not None:
+                queue.put_nowait(partial)
+            task.add_done_callback(lambda _: queue.put_nowait(None))
+            seen = None
+            while (tree := await queue.get()) is not None:
+                # The final tree often repeats the last partial one
+                if (len(tree), tree.complete) != seen:
+                    seen = (len(tree), tree.complete)
+                    yield tree
+            # Surface a failed build to this caller too
+            await asyncio.shield(task)
+        finally:
+            watchers.discard(queue)
+            if not watchers:
+                _tree_watchers.pop(index_key, None)
+
+    async def _build_tree(self, owner: str, repo: str, ref: Dict[str, str]) -> AsyncIterator[RepoTree]:
+        sha = ref['sha']
+        index_key = (owner, repo, sha)
+        cache_key = f"tree_{owner}_{repo}_{sha}"
+        pinned = sha != ref['branch']
+        snapshot_key = f"snapshot_{owner}_{repo}_{sha}"
+        cached = self.get_cache_entry(cache_key)
+        tree = None
+        if self.git_mirrors and pinned:
+            tree = await self.load_mirror_tree(owner, repo, sha)
+        if tree is None and pinned and not cached:
+            tree = await self.patch_tree(owner, repo, sha)
+            if tree is not None:
+                self.save_to_cache(cache_key, tree.to_json())
+                if self.snapshot_mode:
+                    # Unchanged blobs are still in the store from the last snapshot
+                    self.save_to_cache(snapshot_key, True)
+        if tree is None and self.snapshot_mode and pinned and not self.get_from_cache(snapshot_key):
+            # Only fills the blob store: tarballs leave out export-ignore paths
+            # and rewrite export-subst files, so the tree comes from the API
+            await self.load_snapshot(owner, repo, sha)
+        if tree is not None:
+            self.record_head(owner, repo, sha)
+        elif cached and (pinned or cached.is_fresh()):
+            tree = RepoTree.from_json(cached.value)
+        if tree is None:
+            tree = RepoTree()
+            # Marked complete once every subtree has been merged
+            tree.complete = False
+            try:
+                async for items in self.walk_tree(owner, repo, sha):
+                    tree.add(items)
+                    yield tree
+            except TreeWalkError as e:
+                print(f"Error fetching tree for {owner}/{repo}: {str(e)}")
+                if not len(tree):
+                    return
+                # Hand back what we have, but don't cache an incomplete tree
+                yield tree
+                return
+            tree.complete = True
+            self.save_to_cache(
+                cache_key,
+                tree.to_json(),
+                ttl=None if pinned else self.cache_ttls.get('tree'),
+            )
+            if pinned:
+                self.record_head(owner, repo, sha)
+
+        _tree_indexes[index_key] = tree
+        while len(_tree_indexes) > self.max_tree_indexes:
+            _tree_indexes.popitem(last=False)
+        yield tree
+
+    def record_head(self, owner: str, repo: str, sha: str):
+        """Remember ``sha`` as the newest indexed commit, and the one it replaced"""
+        key = f"head_{owner}_{repo}"
+        head = self.get_from_cache(key)
+        if head and head['sha'] == sha:
+            return
+        self.save_to_cache(key, {'sha': sha, 'previous': head['sha'] if head else None})
+
+    def previous_head(self, owner: str, repo: str, sha: str) -> str | None:
+        """The most recent other commit of the repo that was indexed, if any"""
+        head = self.get_from_cache(f"head_{owner}_{repo}")
+        if not head:
+            return None
+        return head['sha'] if head['sha'] != sha else head.get('previous')
+
+    async def patch_tree(self, owner: str, repo: str, sha: str) -> RepoTree | None:
+        """Build the tree at ``sha`` from the last indexed commit and the compare API.
+
+        Only files the compare lists as changed are downloaded (into the blob
+        store), so a push costs work in proportion to its diff. Returns None
+        to fall back to a full fetch if there is no earlier tree, the new
+        commit isn't a descendant of it, or the diff is too large to list.
+        """
+        previous = self.previous_head(owner, repo, sha)
+        if previous is None:
+            return None
+        old = _tree_indexes.get((owner, repo, previous))
+        if old is None:
+            cached = self.get_from_cache(f"tree_{owner}_{repo}_{previous}")
+            if cached is None:
+                return None
+            old = RepoTree.from_json(cached)
+
+        try:
+            response = await self.github_request(
+                f'https://api.github.com/repos/{owner}/{repo}/compare/{previous}...{sha}',
+                priority=PRIORITY_LOW,
+                authenticated=self.repo_auth(owner, repo)
+            )
+        except Exception as e:
+            print(f"Exception comparing {owner}/{repo} {previous[:7]}...{sha[:7]}: {str(e)}")
+            return None
+        if response.status_code != 200:
+            print(f"Error comparing {owner}/{repo} {previous[:7]}...{sha[:7]}: {response.status_code}")
+            return None
+        data = response.json()
+        files = data.get('files') or []
+        # A three-dot compare diffs against the merge base, which is only the
+        # old commit when the new one descends from it
+        if data.get('status') not in ('ahead', 'identical') or len(files) >= MAX_COMPARE_FILES:
+            print(f"Can't patch {owner}/{repo} from {previous[:7]}: {data.get('status')}, {len(files)} files")
+            return None
+
+        changes: Dict[str, Dict[str, Any] | None] = {}
+        downloads = []
+        for file in files:
+            if file['status'] == 'renamed' and file.get('previous_filename'):
+                changes[file['previous_filename']] = None
+            if file['status'] == 'removed':
+                changes[file['filename']] = None
+            elif file['status'] != 'unchanged':
+                downloads.append({'path': file['filename'], 'type': 'blob', 'sha': file['sha']})
+        semaphore = asyncio.Semaphore(self.file_fetch_concurrency)
+
+        async def fetch(item: Dict[str, Any]) -> bool:
+            data = await self._blobs.aget(item['sha'])
+            if data is None:
+                async with semaphore:
+                    data = await _inflight.do(
+                        ('blob', item['sha']),
+                        lambda: self._download_file(owner, repo, sha, item['path'], item),
+                    )
+            if data is None:
+                return False
+            # Sizes aren't in the compare response, so take them from the body
+            changes[item['path']] = {**item, 'size': len(data)}
+            return True
+
+        if not all(await asyncio.gather(*(fetch(item) for item in downloads))):
+            return None
+        print(f"Patched {owner}/{repo} tree {previous[:7]} -> {sha[:7]}: {len(changes)} paths changed")
+        return old.patched(changes)
+
+    async def mirror_path(self, owner: str, repo: str) -> Path | None:
+        """Local mirror of the repo, cloned or refreshed as needed; None on failure"""
+        token = None
+        if self.repo_auth(owner, repo):
+            token = self._token_pool.tokens[0].token
+        try:
+            return await _inflight.do(('mirror', owner, repo), lambda: self._mirrors.ensure(owner, repo, token))
+        except GitError as e:
+            print(f"Error updating git mirror of {owner}/{repo}: {str(e)}")
+            return None
+
+    async def load_mirror_tree(self, owner: str, repo: str, sha: str) -> RepoTree | None:
+        """Index the tree at ``sha`` from the local mirror; None to fall back to the API"""
+        path = await self.mirror_path(owner, repo)
+        if path is None:
+            return None
+        try:
+            return RepoTree(await self._mirrors.list_tree(path, sha))
+        except GitError as e:
+            print(f"Error listing {owner}/{repo}@{sha[:7]} from mirror: {str(e)}")
+            return None
+
+    async def load_snapshot(self, owner: str, repo: str, sha: str) -> bool:
+        """Download the tarball for ``sha`` into the blob store.
+
+        The archive is streamed and unpacked entry by entry, so memory use is
+        bounded by the largest file kept (``snapshot_max_file_bytes``); bigger
+        files are fetched on demand. Blobs are stored under the SHA of their
+        actual content, so files the archive altered are simply never hit.
+        Returns False on failure so callers can fetch files one by one.
+        """
+        return await _inflight.do(('snapshot', owner, repo, sha), lambda: self._download_snapshot(owner, repo, sha))
+
+    async def _download_snapshot(self, owner: str, repo: str, sha: str) -> bool:
+        entries = 0
+
+        def on_entry(entry: Dict[str, Any]):
+            nonlocal entries
+            entries += 1
+            if entry['data'] is not None:
+                self._blobs.put(entry['sha'], entry['data'])
+
+        try:
+            async with self._token_pool.lease(
+                priority=PRIORITY_LOW, authenticated=self.repo_auth(owner, repo)
+            ) as state:
+                received = await download_snapshot(
+                    self.client,
+                    f'https://api.github.com/repos/{owner}/{repo}/tarball/{sha}',
+                    self.get_headers(state.token),
+                    on_entry,
+                    self.snapshot_max_file_bytes,
+                )
+        except (SnapshotError, httpx.HTTPError, RateLimitExceeded) as e:
+            print(f"Error downloading snapshot of {owner}/{repo}: {str(e)}")
+            return False
+        print(f"Snapshot of {owner}/{repo}@{sha[:7]}: {entries} entries, {received} bytes")
+        self.save_to_cache(f"snapshot_{owner}_{repo}_{sha}", True)
+        return True
+
+    async def walk_tree(self, owner: str, repo: str, sha: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield batches of tree items with repo-relative paths.
+
+        Starts with one recursive request. If GitHub marks a listing as
+        truncated, that directory is listed non-recursively and each of its
+        subdirectories is fetched recursively in parallel, at most
+        ``tree_walk_concurrency`` requests at a time. Raises TreeWalkError if
+        any subtree fails.
+        """
+        semaphore = asyncio.Semaphore(self.tree_walk_concurrency)
+        authenticated = self.repo_auth(owner, repo)
+        done: asyncio.Queue = asyncio.Queue()
+        tasks = set()
+
+        async def fetch(tree_sha: str, recursive: bool) -> Dict[str, Any]:
+            url = f'https://api.github.com/repos/{owner}/{repo}/git/trees/{tree_sha}'
+            if recursive:
+                url += '?recursive=1'
+            async with semaphore:
+                try:
+                    response = await self.github_request(url, priority=PRIORITY_LOW, authenticated=authenticated)
+                except Exception as e:
+                    raise TreeWalkError(f"{tree_sha}: {str(e)}") from e
+            if response.status_code != 200:
+                raise TreeWalkError(f"{tree_sha}: {response.status_code} {response.text[:200]}")
+            return response.json()
+
+        async def visit(tree_sha: str, prefix: str) -> List[Dict[str, Any]]:
+            data = await fetch(tree_sha, recursive=True)
+            recursive = not data.get('truncated')
+            if not recursive:
+                data = await fetch(tree_sha, recursive=False)
+            items = [{**item, 'path': prefix + item['path']} for item in data['tree']]
+            if not recursive:
+                for item in items:
+                    if item['type'] == 'tree':
+                        spawn(item['sha'], item['path'] + '/')
+            return items
+
+        def spawn(tree_sha: str, prefix: str):
+            task = asyncio.create_task(visit(tree_sha, prefix))
+            tasks.add(task)
+            task.add_done_callback(done.put_nowait)
+
+        spawn(sha, '')
+        try:
+            while tasks:
+                task = await done.get()
+                tasks.discard(task)
+                yield task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_file_bytes(self, owner: str, repo: str, path: str) -> bytes | None:
+        """Get a file body at the pinned commit, via the blob cache.
+
+        The blob SHA comes from the tree index, so a file already seen in any
+        repo, branch or session is served from memory or disk. Downloaded
+        bodies are verified against the SHA before they are cached. Returns
+        None if the file doesn't exist or can't be fetched.
+        """
+        path = path.strip('/')
+        tree = await self.get_tree(owner, repo)
+        item = tree.lookup(path) if tree is not None else None
+        if item is not None:
+            if item['type'] != 'blob':
+                return None
+            data = await self._blobs.aget(item['sha'])
+            if data is not None:
+                return data
+        elif tree is not None and tree.complete:
+            return None
+
+        ref = await self.resolve_ref(owner, repo)
+        if not ref:
+            return None
+        # Identical blobs are fetched once however many paths or repos want them
+        key = ('blob', item['sha']) if item is not None else ('raw', owner, repo, ref['sha'], path)
+        return await _inflight.do(key, lambda: self._download_file(owner, repo, ref['sha'], path, item))
+
+    async def _download_file(
+        self, owner: str, repo: str, sha: str, path: str, item: Dict[str, Any] | None
+    ) -> bytes | None:
+        if self.git_mirrors and item is not None:
+            mirror = await self.mirror_path(owner, repo)
+            if mirror is not None:
+                token = self._token_pool.tokens[0].token if self.repo_auth(owner, repo) else None
+                try:
+                    data = await self._mirrors.read_blob(mirror, item['sha'], token)
+                    await self._blobs.aput(item['sha'], data)
+                    return data
+                except GitError as e:
+                    print(f"Error reading {path} from {owner}/{repo} mirror: {str(e)}")
+
+        try:
+            response = await self.github_request(
+                f'https://raw.githubusercontent.com/{owner}/{repo}/{sha}/{path}',
+                resource=None,
+                authenticated=self.repo_auth(owner, repo)
+            )
+        except Exception as e:
+            print(f"Exception fetching {path} from {owner}/{repo}: {str(e)}")
+            return None
+        if response.status_code != 200:
+            print(f"Error fetching {path} from {owner}/{repo}: {response.status_code}")
+            return None
+
+        data = response.content
+        if item is not None:
+            if git_blob_sha(data) == item['sha']:
+                await self._blobs.aput(item['sha'], data)
+            else:
+                print(f"Blob SHA mismatch for {owner}/{repo}/{path}, not caching")
+        return data
+
+    async def get_files(self, owner: str, repo: str, paths: List[str]) -> Dict[str, bytes | None]:
+        """Fetch several files concurrently, at most file_fetch_concurrency at once.
+
+        Returns a dict of path to body (None for files that couldn't be read),
+        in the order requested.
+        """
+        # Load the tree once up front rather than racing N lookups for it
+        await self.get_tree(owner, repo)
+        semaphore = asyncio.Semaphore(self.file_fetch_concurrency)
+
+        async def fetch(path: str) -> bytes | None:
+            async with semaphore:
+                return await self.get_file_bytes(owner, repo, path)
+
+        results = await asyncio.gather(*(fetch(path) for path in paths))
+        return dict(zip(paths, results))
+
+    async def get_search_index(self, owner: str, repo: str) -> TrigramIndex | None:
+        """Get the code search index of the pinned default-branch commit.
+
+        Built once per (repo, SHA) from the blob store, downloading any files
+        not cached yet, then kept in memory and on disk next to the blobs.
+        """
+        ref = await self.resolve_ref(owner, repo)
+        if not ref:
+            return None
+        index_key = (owner, repo, ref['sha'])
+        index = _search_indexes.get(index_key)
+        if index is not None:
+            _search_indexes.move_to_end(index_key)
+            return index
+        return await _inflight.do(('search', *index_key), lambda: self._load_search_index(owner, repo, ref))
+
+    async def _load_search_index(self, owner: str, repo: str, ref: Dict[str, str]) -> TrigramIndex | None:
+        sha = ref['sha']
+        pinned = sha != ref['branch']
+        path = self.search_index_path(owner, repo, sha)
+        index = await asyncio.to_thread(TrigramIndex.load, path) if pinned else None
+        if index is None:
+            tree = await self.get_tree(owner, repo)
+            if tree is None:
+                return None
+            # Start from the previous commit's index so only changed files are read
+            index = await self.previous_search_index(owner, repo, sha) or TrigramIndex()
+            complete = await self.update_search_index(index, owner, repo, tree)
+            print(f"Indexed {len(index)} files of {owner}/{repo}@{sha[:7]} for search")
+            # Like trees, only keep complete indexes of a fixed commit
+            if pinned and tree.complete and complete:
+                await asyncio.to_thread(self.save_search_index, index, owner, repo, sha)
+
+        index_key = (owner, repo, sha)
+        _search_indexes[index_key] = index
+        while len(_search_indexes) > self.max_search_indexes:
+            _search_indexes.popitem(last=False)
+        return index
+
+    def search_index_path(self, owner: str, repo: str, sha: str) -> Path:
+        return Path(self._blob_dir) / 'search' / f"{owner}_{repo}_{sha}.json.gz"
+
+    def save_search_index(self, index: TrigramIndex, owner: str, repo: str, sha: str):
+        """Write an index to disk and delete all but the repo's newest SEARCH_INDEXES_PER_REPO"""
+        path = self.search_index_path(owner, repo, sha)
+        index.save(path)
+        name = re.compile(re.escape(f"{owner}_{repo}_") + r'[0-9a-f]{40,64}\.json\.gz')
+        saved = []
+        for file in path.parent.iterdir():
+            if name.fullmatch(file.name):
+                try:
+                    saved.append((file.stat().st_mtime, file))
+                except OSError:
+                    continue
+        for _, file in sorted(saved, reverse=True)[SEARCH_INDEXES_PER_REPO:]:
+            if file != path:
+                file.unlink(missing_ok=True)
+
+    async def previous_search_index(self, owner: str, repo: str, sha: str) -> TrigramIndex | None:
+        """A copy of the search index of the last indexed commit, if there is one"""
+        previous = self.previous_head(owner, repo, sha)
+        if previous is None:
+            return None
+        index = _search_indexes.get((owner, repo, previous))
+        if index is not None:
+            return await asyncio.to_thread(index.copy)
+        return await asyncio.to_thread(TrigramIndex.load, self.search_index_path(owner, repo, previous))
+
+    async def fill_blobs(self, owner: str, repo: str, shas: List[str]):
+        """Download the pinned commit's tarball when most of ``shas`` aren't stored yet.
+
+        Used before reading many files at once: one archive request replaces
+        hundreds of file downloads. Files it doesn't cover are fetched later
+        one by one as usual.
+        """
+        if self.git_mirrors or len(shas) < SNAPSHOT_FILL_MIN_FILES:
+            return
+        ref = await self.resolve_ref(owner, repo)
+        if not ref or ref['sha'] == ref['branch']:
+            return
+        missing = await asyncio.to_thread(lambda: sum(sha not in self._blobs for sha in shas))
+        if missing >= SNAPSHOT_FILL_MIN_FILES and missing * 2 > len(shas):
+            print(f"{missing} of {len(shas)} files of {owner}/{repo} not cached, downloading the tarball")
+            await self.load_snapshot(owner, repo, ref['sha'])
+
+    async def update_search_index(self, index: TrigramIndex, owner: str, repo: str, tree: RepoTree) -> bool:
+        """Bring ``index`` in line with ``tree``, reading only files whose blob changed.
+
+        Returns False if some files couldn't be downloaded.
+        """
+        files = indexable_files(tree)
+        index.skipped = max(len(files) - self.search_max_files, 0)
+        wanted = dict(files[:self.search_max_files])
+        removed = {}
+        for path, sha in list(index.files.items()):
+            if wanted.get(path) != sha:
+                # The old body lets remove() touch only that file's trigrams
+                removed[path] = await self._blobs.aget(sha)
+        missing = [path for path in wanted if index.files.get(path) != wanted[path]]
+        await self.fill_blobs(owner, repo, [wanted[path] for path in missing])
+        contents = await self.get_files(owner, repo, missing)
+
+        def apply():
+            # Trigram extraction is CPU-bound, so it runs off the event loop
+            for path, old in removed.items():
+                index.remove(path, decode_text(old) if old is not None else None)
+            for path in missing:
+                if contents[path] is not None:
+                    # Binary files are kept without trigrams so they aren't read again
+                    index.add(path, wanted[path], decode_text(contents[path]) or '')
+
+        await asyncio.to_thread(apply)
+        return all(contents[path] is not None for path in missing)
+
+    async def search_code(
+        self,
+        owner: str,
+        repo: str,
+        query: str,
+        regex: bool = False,
+        path_pattern: str | None = None,
+        max_results: int = 50,
+    ) -> Tuple[TrigramIndex, List[Tuple[str, int, str]], int] | None:
+        """Search file contents; returns (index, [(path, line, text)], total hits) or None"""
+        index = await self.get_search_index(owner, repo)
+        if index is None:
+            return None
+
+        async def load(path: str, sha: str) -> bytes | None:
+            data = await self._blobs.aget(sha)
+            if data is None:
+                data = await self.get_file_bytes(owner, repo, path)
+            return data
+
+        hits, total = await index.search(
+            query, load, regex=regex, path_pattern=path_pattern, max_results=max_results
+        )
+        return index, hits, total
+
+    async def get_symbol_table(self, owner: str, repo: str) -> SymbolTable | None:
+        """Get the symbols of every supported source file at the pinned commit"""
+        ref = await self.resolve_ref(owner, repo)
+        if not ref:
+            return None
+        table_key = (owner, repo, ref['sha'])
+        table = _symbol_tables.get(table_key)
+        if table is not None:
+            _symbol_tables.move_to_end(table_key)
+            return table
+        return await _inflight.do(('symbols', *table_key), lambda: self._build_symbol_table(owner, repo, ref))
+
+    async def _build_symbol_table(self, owner: str, repo: str, ref: Dict[str, str]) -> SymbolTable | None:
+        tree = await self.get_tree(owner, repo)
+        if tree is None:
+            return None
+        files = [(path, sha) for path, sha in indexable_files(tree) if language_for(path)]
+        table = SymbolTable(skipped=max(len(files) - self.search_max_files, 0))
+        files = files[:self.search_max_files]
+        previous_sha = self.previous_head(owner, repo, ref['sha'])
+        previous = _symbol_tables.get((owner, repo, previous_sha)) if previous_sha else None
+
+        missing = []
+        for path, sha in files:
+            if previous is not None and previous.blobs.get(path) == sha:
+                symbols = previous.files[path]
+            else:
+                symbols = self.cached_symbols(path, sha)
+            if symbols is None:
+                missing.append((path, sha))
+            else:
+                table.files[path] = symbols
+                table.blobs[path] = sha
+        await self.fill_blobs(owner, repo, [sha for _, sha in missing])
+        contents = await self.get_files(owner, repo, [path for path, _ in missing])
+        for path, sha in missing:
+            symbols = await self.blob_symbols(path, sha, contents[path])
+            if symbols is not None:
+                table.files[path] = symbols
+                table.blobs[path] = sha
+        print(f"Symbols of {owner}/{repo}@{ref['sha'][:7]}: {len(files)} files, {len(missing)} parsed")
+
+        table_key = (owner, repo, ref['sha'])
+        _symbol_tables[table_key] = table
+        while len(_symbol_tables) > self.max_search_indexes:
+            _symbol_tables.popitem(last=False)
+        return table
+
+    def cached_symbols(self, path: str, sha: str) -> List[Symbol] | None:
+        """Previously extracted symbols of a blob, or None if it hasn't been parsed"""
+        cached = self.get_from_cache(f"symbols{SYMBOLS_VERSION}_{language_for(path)}_{sha}")
+        return [Symbol.from_json(s) for s in cached] if cached is not None else None
+
+    async def blob_symbols(self, path: str, sha: str, data: bytes | None) -> List[Symbol] | None:
+        """Extract and cache the symbols of a blob; None if it couldn't be read"""
+        if data is None:
+            return None
+        text = decode_text(data)
+        # Parsing is CPU-bound, so it runs off the event loop
+        symbols = await asyncio.to_thread(extract_symbols, path, text) if text is not None else []
+        self.save_to_cache(
+            f"symbols{SYMBOLS_VERSION}_{language_for(path)}_{sha}",
+            [s.to_json() for s in symbols],
+        )
+        return symbols
+
+    async def get_file_symbols(self, owner: str, repo: str, path: str) -> List[Symbol] | None:
+        """Symbols of one file, parsing it only if its blob hasn't been seen before"""
+        path = path.strip('/')
+        tree = await self.get_tree(owner, repo)
+        item = tree.lookup(path) if tree is not None else None
+        if item is None or item['type'] != 'blob':
+            return None
+        symbols = self.cached_symbols(path, item['sha'])
+        if symbols is None:
+            symbols = await self.blob_symbols(path, item['sha'], await self.get_file_bytes(owner, repo, path))
+        return symbols
@@ -0,0 +1,101 @@
+import json
+from typing import Any, Dict, List
+
+GRAPHQL_URL = 'https://api.github.com/graphql'
+
+# Files fetched along with the repository overview, first match wins
+README_CANDIDATES = ['README.md', 'README.rst', 'README.txt', 'README', 'readme.md']
+
+REPO_OVERVIEW_QUERY = """
+query RepoOverview($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    nameWithOwner
+    description
+    url
+    isPrivate
+    diskUsage
+    stargazerCount
+    forkCount
+    primaryLanguage { name }
+    createdAt
+    updatedAt
+    pushedAt
+    defaultBranchRef {
+      name
+      target {
+        oid
+        ... on Commit {
+          tree {
+            entries {
+              name
+              type
+              oid
+              object { ... on Blob { byteSize } }
+            }
+          }
+        }
+      }
+    }
+%s
+  }
+}
+"""
+
+
+def build_overview_query(paths: List[str]) -> str:
+    """Overview query that also fetches the blobs at ``paths`` on the default branch"""
+    blobs = "\n".join(
+        f"    file{i}: object(expression: {json.dumps('HEAD:' + path)}) "
+        f"{{ ... on Blob {{ oid byteSize isBinary isTruncated text }} }}"
+        for i, path in enumerate(paths)
+    )
+    return REPO_OVERVIEW_QUERY % blobs
+
+
+def parse_overview(repository: Dict[str, Any], paths: List[str]) -> Dict[str, Any]:
+    """Map a GraphQL ``repository`` object onto the REST shapes used elsewhere.
+
+    Returns {'repo': ..., 'ref': ..., 'entries': [...], 'files': [...]} where
+    ``repo`` has the REST /repos fields the tools read, ``ref`` is
+    {'branch', 'sha'} as from resolve_ref, ``entries`` are top-level tree
+    items and ``files`` are the requested blobs that exist.
+    """
+    branch_ref = repository.get('defaultBranchRef') or {}
+    target = branch_ref.get('target') or {}
+    repo = {
+        'full_name': repository['nameWithOwner'],
+        'description': repository.get('description'),
+        'html_url': repository.get('url'),
+        'private': repository.get('isPrivate'),
+        'size': repository.get('diskUsage') or 0,
+        'stargazers_count': repository.get('stargazerCount'),
+        'forks_count': repository.get('forkCount'),
+        'language': (repository.get('primaryLanguage') or {}).get('name'),
+        'created_at': repository.get('createdAt'),
+        'updated_at': repository.get('updatedAt'),
+        'pushed_at': repository.get('pushedAt'),
+        'default_branch': branch_ref.get('name'),
+    }
+    ref = {'branch': branch_ref['name'], 'sha': target['oid']} if branch_ref and target.get('oid') else None
+    entries = [
+        {
+            'path': entry['name'],
+            'type': 'tree' if entry['type'] == 'tree' else 'blob',
+            'sha': entry['oid'],
+            'size': (entry.get('object') or {}).get('byteSize', 0),
+        }
+        for entry in ((target.get('tree') or {}).get('entries') or [])
+        if entry['type'] in ('tree', 'blob')
+    ]
+    files = []
+    for i, path in enumerate(paths):
+        blob = repository.get(f'file{i}')
+        if blob and blob.get('oid'):
+            files.append({
+                'path': path,
+                'sha': blob['oid'],
+                'size': blob.get('byteSize', 0),
+                # Missing for binary files and ones too large to inline
+                'text': None if blob.get('isBinary') or blob.get('isTruncated') else blob.get('text'),
+            })
+    return {'repo': repo, 'ref': ref, 'entries': entries, 'files': files}
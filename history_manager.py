@@ -0,0 +1,151 @@
+import json
+from dataclasses import replace
+from typing import Dict, List
+
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    RetryPromptPart,
+    SystemPromptPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+
+# Rough characters-per-token ratio; an estimate is enough to stay under budget
+CHARS_PER_TOKEN = 4
+DEFAULT_HISTORY_TOKENS = 8000
+# Tool outputs above this size are replaced by a reference once they're old
+DEFAULT_TOOL_OUTPUT_TOKENS = 500
+PART_OVERHEAD_TOKENS = 4
+PREVIEW_CHARS = 300
+
+
+def _part_text(part) -> str:
+    if isinstance(part, ToolReturnPart):
+        return part.model_response_str()
+    if isinstance(part, ToolCallPart):
+        return part.tool_name + part.args_as_json_str()
+    if isinstance(part, RetryPromptPart):
+        return part.model_response()
+    content = getattr(part, 'content', '')
+    return content if isinstance(content, str) else json.dumps(content, default=str)
+
+
+def estimate_tokens(message: ModelMessage) -> int:
+    """Approximate prompt tokens a message costs, from its text length"""
+    return sum(len(_part_text(part)) // CHARS_PER_TOKEN + PART_OVERHEAD_TOKENS for part in message.parts)
+
+
+def split_turns(messages: List[ModelMessage]) -> List[List[ModelMessage]]:
+    """Group messages into turns, each starting at a request with a user prompt.
+
+    Anything before the first user prompt forms a turn of its own. Cutting
+    history only between turns keeps every tool call with its result.
+    """
+    turns: List[List[ModelMessage]] = []
+    for message in messages:
+        starts_turn = isinstance(message, ModelRequest) and any(
+            isinstance(part, UserPromptPart) for part in message.parts
+        )
+        if starts_turn or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _tool_calls(turn: List[ModelMessage]) -> Dict[int, ToolCallPart]:
+    """Map each tool return in a turn (by id()) to the call that produced it"""
+    calls: List[ToolCallPart] = []
+    matched: Dict[int, ToolCallPart] = {}
+    for message in turn:
+        for part in message.parts:
+            if isinstance(part, ToolCallPart):
+                calls.append(part)
+            elif isinstance(part, ToolReturnPart):
+                for call in calls:
+                    if (call.tool_call_id is not None and call.tool_call_id == part.tool_call_id) or (
+                        part.tool_call_id is None and call.tool_name == part.tool_name
+                    ):
+                        matched[id(part)] = call
+                        calls.remove(call)
+                        break
+    return matched
+
+
+def stub_tool_outputs(turn: List[ModelMessage], max_tool_tokens: int) -> List[ModelMessage]:
+    """Replace large tool results in a turn with a short reference.
+
+    The return part keeps its tool name and call id, so the call/return
+    pairing the model API requires is preserved. The reference names the
+    call's arguments; repeating it is cheap since the GitHub data behind
+    every tool is cached.
+    """
+    calls = _tool_calls(turn)
+    compacted = []
+    for message in turn:
+        if not isinstance(message, ModelRequest):
+            compacted.append(message)
+            continue
+        parts = []
+        for part in message.parts:
+            if isinstance(part, ToolReturnPart):
+                text = part.model_response_str()
+                tokens = len(text) // CHARS_PER_TOKEN
+                if tokens > max_tool_tokens:
+                    call = calls.get(id(part))
+                    args = call.args_as_json_str() if call else '{}'
+                    preview = text[:PREVIEW_CHARS].rstrip()
+                    part = replace(part, content=(
+                        f"[Output of {part.tool_name}({args}) omitted from history (~{tokens} tokens). "
+                        f"Call the tool again if you need it. It began:]\n{preview}\n…"
+                    ))
+            parts.append(part)
+        compacted.append(replace(message, parts=parts))
+    return compacted
+
+
+def compact_history(
+    messages: List[ModelMessage],
+    max_tokens: int = DEFAULT_HISTORY_TOKENS,
+    max_tool_tokens: int = DEFAULT_TOOL_OUTPUT_TOKENS,
+    keep_recent_turns: int = 1,
+) -> List[ModelMessage]:
+    """Fit message history into a token budget.
+
+    Large tool outputs are replaced by references in all but the last
+    ``keep_recent_turns`` turns, and in those too if they alone exceed the
+    budget. If that isn't enough the oldest turns are dropped whole; the
+    most recent turn is always kept. System prompt parts from a dropped
+    first turn are moved onto the new first request so instructions
+    survive the cut.
+    """
+    turns = split_turns(messages)
+    if not turns:
+        return []
+    system_parts = [
+        part for part in turns[0][0].parts if isinstance(part, SystemPromptPart)
+    ] if isinstance(turns[0][0], ModelRequest) else []
+
+    cutoff = max(len(turns) - keep_recent_turns, 0)
+    turns = [
+        stub_tool_outputs(turn, max_tool_tokens) if i < cutoff else turn
+        for i, turn in enumerate(turns)
+    ]
+    costs = [sum(estimate_tokens(message) for message in turn) for turn in turns]
+    if sum(costs[cutoff:]) > max_tokens:
+        # The recent turns alone don't fit; stub them rather than lose the rest
+        turns = turns[:cutoff] + [stub_tool_outputs(turn, max_tool_tokens) for turn in turns[cutoff:]]
+        costs = costs[:cutoff] + [sum(estimate_tokens(message) for message in turn) for turn in turns[cutoff:]]
+    total = sum(costs)
+    while len(turns) > 1 and total > max_tokens:
+        total -= costs.pop(0)
+        turns.pop(0)
+
+    result = [message for turn in turns for message in turn]
+    first = result[0]
+    if system_parts and isinstance(first, ModelRequest) and not any(
+        isinstance(part, SystemPromptPart) for part in first.parts
+    ):
+        result[0] = replace(first, parts=system_parts + list(first.parts))
+    return result
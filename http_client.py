@@ -0,0 +1,111 @@
+import asyncio
+import os
+from typing import Callable, Dict
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body wrapper that frees the host slot once the body is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """Caps in-flight requests per host on top of the pool-wide limits.
+
+    httpx only limits connections for the whole pool; this keeps one busy host
+    (e.g. raw.githubusercontent.com during a batch download) from starving
+    api.github.com.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self._max_per_host)
+        await semaphore.acquire()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                semaphore.release()
+
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the shared GitHub HTTP client.
+
+    One client is meant to live for the whole process (the FastAPI lifespan or
+    a CLI session) so TLS connections to GitHub are reused across requests.
+    Limits and timeouts can be tuned through GITHUB_HTTP_* environment variables.
+    """
+    limits = httpx.Limits(
+        max_connections=_env_int('GITHUB_HTTP_MAX_CONNECTIONS', 100),
+        max_keepalive_connections=_env_int('GITHUB_HTTP_MAX_KEEPALIVE', 20),
+        keepalive_expiry=_env_float('GITHUB_HTTP_KEEPALIVE_EXPIRY', 60.0),
+    )
+    timeout = httpx.Timeout(
+        connect=_env_float('GITHUB_HTTP_CONNECT_TIMEOUT', 5.0),
+        read=_env_float('GITHUB_HTTP_READ_TIMEOUT', 30.0),
+        write=_env_float('GITHUB_HTTP_WRITE_TIMEOUT', 10.0),
+        pool=_env_float('GITHUB_HTTP_POOL_TIMEOUT', 10.0),
+    )
+    transport = httpx.AsyncHTTPTransport(
+        http2=HTTP2_AVAILABLE,
+        limits=limits,
+        retries=1,
+    )
+    return httpx.AsyncClient(
+        transport=HostLimitedTransport(
+            transport,
+            max_per_host=_env_int('GITHUB_HTTP_MAX_PER_HOST', 20),
+        ),
+        timeout=timeout,
+        follow_redirects=True,
+    )
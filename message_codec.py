@@ -0,0 +1,38 @@
+import base64
+import json
+import zlib
+from typing import Any, Dict, List
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+
+# Message lists bigger than this (as compact JSON) are stored compressed
+COMPRESS_THRESHOLD = 4096
+
+
+def encode_messages(messages: List[ModelMessage], compress_threshold: int = COMPRESS_THRESHOLD) -> Dict[str, Any]:
+    """Serialize pydantic-ai messages into a JSON-safe dict for the ``data`` column.
+
+    Small histories are stored as plain JSON so they stay readable in the
+    table. Larger ones, which are mostly tool output like file contents and
+    trees, are zlib-compressed and base64-encoded.
+    """
+    raw = ModelMessagesTypeAdapter.dump_json(messages)
+    if len(raw) <= compress_threshold:
+        return {"messages": json.loads(raw)}
+    packed = base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+    return {"messages_z": packed}
+
+
+def decode_messages(data: Dict[str, Any] | None) -> List[ModelMessage] | None:
+    """Inverse of ``encode_messages``; None if ``data`` holds no message history"""
+    if not data:
+        return None
+    try:
+        if "messages_z" in data:
+            raw = zlib.decompress(base64.b64decode(data["messages_z"]))
+            return ModelMessagesTypeAdapter.validate_json(raw)
+        if "messages" in data:
+            return ModelMessagesTypeAdapter.validate_python(data["messages"])
+    except Exception as e:
+        print(f"Ignoring unreadable message history: {str(e)}")
+    return None
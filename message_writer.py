@@ -0,0 +1,141 @@
+import asyncio
+import itertools
+import random
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+
+class MessageWriter:
+    """Write-behind queue for Supabase inserts.
+
+    ``write`` only queues the row; a background task collects rows from all
+    sessions and inserts them in one request per batch, flushing when
+    ``batch_size`` rows are waiting or ``flush_interval`` seconds after the
+    first one arrived. The queue holds at most ``max_pending`` rows, after
+    which ``write`` waits for room. Failed inserts are retried with
+    exponential backoff and dropped (with a log line) after ``max_retries``.
+
+    Each row is stamped with ``created_at`` when it is queued, so ordering by
+    that column stays correct even when several rows land in one insert.
+    """
+
+    def __init__(
+        self,
+        client,
+        table: str = "messages",
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_pending: int = 10_000,
+        max_retries: int = 5,
+        retry_delay: float = 0.5,
+        max_retry_delay: float = 10.0,
+    ):
+        self.client = client
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        # Rows queued or being inserted, in write order, for read-your-writes
+        self._unwritten: Dict[int, Dict[str, Any]] = {}
+        self._seq = itertools.count()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def write(self, row: Dict[str, Any]):
+        """Queue a row for insertion; waits only if the queue is full"""
+        row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+        seq = next(self._seq)
+        self._unwritten[seq] = row
+        await self._queue.put((seq, row))
+
+    def pending_for(self, session_id: str) -> List[Dict[str, Any]]:
+        """Rows for a session that may not be in the table yet, oldest first"""
+        return [row for row in self._unwritten.values() if row.get("session_id") == session_id]
+
+    async def close(self):
+        """Flush everything still queued and stop the background task"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Shutting down: drain whatever is left without waiting for timers
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[int, Dict[str, Any]]]):
+        rows = [row for _, row in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.client.table(self.table).insert(rows).execute()
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Dropping {len(rows)} messages after {attempt + 1} failed writes: {str(e)}")
+                    break
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+                delay *= random.uniform(0.5, 1.0)
+                print(f"Writing {len(rows)} messages failed ({str(e)}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        for seq, _ in batch:
+            self._unwritten.pop(seq, None)
+
+
+def _timestamp(value: Any) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_pending(
+    stored: List[Dict[str, Any]],
+    pending: List[Dict[str, Any]],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Append queued rows that aren't in ``stored`` yet and keep the last ``limit``.
+
+    A batch can be committed just before its rows leave the pending list, so
+    rows whose ``created_at`` already appears in ``stored`` are skipped.
+    """
+    seen = {_timestamp(row.get("created_at")) for row in stored}
+    merged = stored + [row for row in pending if _timestamp(row.get("created_at")) not in seen]
+    return merged[-limit:]
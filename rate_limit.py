@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+
+import httpx
+
+# Interactive lookups may spend a token's last calls; bulk work like tree
+# walks and snapshots stops at the reserve and waits for the reset instead.
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+
+# Documented hourly limits, used until GitHub reports the real ones
+TOKEN_LIMIT = 5000
+ANONYMOUS_LIMIT = 60
+SECONDARY_BACKOFF = 60
+MAX_SECONDARY_BACKOFF = 900
+
+
+class RateLimitExceeded(Exception):
+    """No credential has quota left within the allowed wait"""
+
+
+@dataclass
+class Bucket:
+    """Quota of one rate-limit resource ('core', 'graphql', ...) for one credential"""
+    limit: int
+    remaining: int
+    reset_at: float = 0.0
+    in_flight: int = 0
+
+    def available(self, now: float) -> int:
+        if self.reset_at and now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = 0.0
+        return self.remaining - self.in_flight
+
+
+@dataclass
+class TokenState:
+    token: str | None
+    buckets: Dict[str, Bucket] = field(default_factory=dict)
+    # Set by Retry-After and secondary rate limits; applies to every resource
+    blocked_until: float = 0.0
+    backoff: float = 0.0
+    in_flight: int = 0
+
+    @property
+    def name(self) -> str:
+        return f"token {self.token[:8]}…" if self.token else "anonymous"
+
+    def bucket(self, resource: str) -> Bucket:
+        if resource not in self.buckets:
+            limit = TOKEN_LIMIT if self.token else ANONYMOUS_LIMIT
+            self.buckets[resource] = Bucket(limit=limit, remaining=limit)
+        return self.buckets[resource]
+
+
+class TokenPool:
+    """Spread GitHub API calls over several tokens by their remaining quota.
+
+    Quota is tracked per token and per rate-limit resource from the
+    ``X-RateLimit-*`` headers of every response. Each call goes to the token
+    with the most calls left. Low-priority calls leave the last ``reserve``
+    fraction of each token for interactive ones. When every token is spent or
+    blocked by a secondary limit, callers wait for the earliest reset, up to
+    ``max_wait`` seconds, and then get RateLimitExceeded.
+    """
+
+    def __init__(self, tokens: Iterable[str], reserve: float = 0.1, max_wait: float = 60):
+        self.tokens = [TokenState(token) for token in dict.fromkeys(t for t in tokens if t)]
+        self.anonymous = TokenState(None)
+        self.reserve = reserve
+        self.max_wait = max_wait
+
+    def _candidates(self, authenticated: bool | None) -> List[TokenState]:
+        if authenticated is False or not self.tokens:
+            return [self.anonymous]
+        return self.tokens
+
+    def _pick(self, candidates: List[TokenState], resource: str | None, priority: int, now: float) -> Tuple[TokenState | None, float]:
+        """Best credential to use now, or None and the time one frees up"""
+        best, best_score = None, None
+        wake = now + self.max_wait + 1
+        for state in candidates:
+            if state.blocked_until > now:
+                wake = min(wake, state.blocked_until)
+                continue
+            if resource is None:
+                # Not quota-limited (raw downloads); just spread the load
+                score = -state.in_flight
+            else:
+                bucket = state.bucket(resource)
+                score = bucket.available(now)
+                floor = 0 if priority == PRIORITY_HIGH else int(bucket.limit * self.reserve)
+                if score <= floor:
+                    if bucket.remaining <= floor and bucket.reset_at:
+                        wake = min(wake, bucket.reset_at)
+                    else:
+                        # Only held back by in-flight calls; check again shortly
+                        wake = min(wake, now + 0.25)
+                    continue
+            if best_score is None or score > best_score:
+                best, best_score = state, score
+        return best, wake
+
+    async def acquire(self, resource: str | None = 'core', priority: int = PRIORITY_HIGH, authenticated: bool | None = None) -> TokenState:
+        candidates = self._candidates(authenticated)
+        deadline = time.time() + self.max_wait
+        while True:
+            now = time.time()
+            state, wake = self._pick(candidates, resource, priority, now)
+            if state is not None:
+                state.in_flight += 1
+                if resource is not None:
+                    state.bucket(resource).in_flight += 1
+                return state
+            if wake > deadline:
+                raise RateLimitExceeded(
+                    f"GitHub rate limit reached for all credentials; next reset in {int(wake - now)}s"
+                )
+            print(f"GitHub quota exhausted, waiting {wake - now:.1f}s")
+            await asyncio.sleep(max(wake - now, 0.05))
+
+    def release(self, state: TokenState, resource: str | None, response: httpx.Response | None = None) -> str | None:
+        """Record a finished call; returns 'primary' or 'secondary' if it was rate limited"""
+        state.in_flight -= 1
+        if resource is not None:
+            state.bucket(resource).in_flight -= 1
+        if response is None:
+            return None
+        now = time.time()
+        headers = response.headers
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            bucket = state.bucket(headers.get('X-RateLimit-Resource', resource or 'core'))
+            try:
+                bucket.limit = int(headers.get('X-RateLimit-Limit', bucket.limit))
+                bucket.remaining = int(remaining)
+                bucket.reset_at = float(headers.get('X-RateLimit-Reset', bucket.reset_at))
+            except ValueError:
+                pass
+        if response.status_code not in (403, 429):
+            state.backoff = 0.0
+            return None
+
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                state.blocked_until = now + float(retry_after)
+            except ValueError:
+                state.blocked_until = now + SECONDARY_BACKOFF
+            return 'secondary'
+        if remaining == '0':
+            return 'primary'
+        if 'rate limit' in response.text.lower():
+            # Secondary limit without Retry-After: wait at least a minute,
+            # doubling while it keeps happening
+            state.backoff = min(max(SECONDARY_BACKOFF, state.backoff * 2), MAX_SECONDARY_BACKOFF)
+            state.blocked_until = now + state.backoff
+            return 'secondary'
+        return None
+
+    @asynccontextmanager
+    async def lease(self, resource: str | None = 'core', priority: int = PRIORITY_HIGH, authenticated: bool | None = None) -> AsyncIterator[TokenState]:
+        """Hold a credential for a call whose response headers aren't tracked"""
+        state = await self.acquire(resource, priority, authenticated)
+        try:
+            yield state
+        finally:
+            self.release(state, resource)
+
+
+# One pool per token set per process, so every session shares quota state.
+_pools: Dict[Tuple[str, ...], TokenPool] = {}
+
+
+def open_token_pool(tokens: Iterable[str]) -> TokenPool:
+    """Return the process-wide pool for these tokens, creating it on first use"""
+    key = tuple(dict.fromkeys(t for t in tokens if t))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = TokenPool(
+            key,
+            reserve=float(os.getenv('GITHUB_RATE_LIMIT_RESERVE', 0.1)),
+            max_wait=float(os.getenv('GITHUB_RATE_LIMIT_MAX_WAIT', 60)),
+        )
+        _pools[key] = pool
+    return pool
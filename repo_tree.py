@@ -0,0 +1,229 @@
+import bisect
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+GLOB_CHARS = '*?['
+
+
+class TreeNode:
+    """Trie node for one directory (or file) in a repository tree"""
+    __slots__ = ('type', 'size', 'files', 'children')
+
+    def __init__(self, type: str = 'tree'):
+        self.type = type
+        self.size = 0
+        self.files = 0
+        self.children: Dict[str, 'TreeNode'] | None = {} if type == 'tree' else None
+
+
+class RepoTree:
+    """In-memory index of a repository tree at one commit.
+
+    Keeps a dict for O(1) path lookups, a sorted path list for prefix and glob
+    range scans, and a prefix trie whose directory nodes carry aggregated file
+    counts and byte sizes. Entries use the GitHub git/trees item format.
+    """
+
+    def __init__(self, entries: Iterable[Dict[str, Any]] = ()):
+        self._entries: Dict[str, Tuple[str, int, str | None]] = {}
+        self._paths: List[str] = []
+        self._sorted = True
+        self.root = TreeNode()
+        # False when some subtrees could not be fetched
+        self.complete = True
+        self.add(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: str) -> bool:
+        return path.strip('/') in self._entries
+
+    def add(self, entries: Iterable[Dict[str, Any]]):
+        """Merge GitHub tree items into the index"""
+        for item in entries:
+            path = item['path'].strip('/')
+            if not path or path in self._entries:
+                continue
+            type_ = item['type']
+            size = item.get('size') or 0
+            self._entries[path] = (type_, size, item.get('sha'))
+            self._paths.append(path)
+            self._sorted = False
+            self._insert(path, type_, size)
+
+    def _insert(self, path: str, type_: str, size: int):
+        node = self.root
+        parts = path.split('/')
+        for part in parts[:-1]:
+            if type_ != 'tree':
+                node.files += 1
+                node.size += size
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = TreeNode()
+            node = child
+        if type_ != 'tree':
+            node.files += 1
+            node.size += size
+        leaf = node.children.get(parts[-1])
+        if leaf is None:
+            node.children[parts[-1]] = TreeNode(type_)
+            if type_ != 'tree':
+                node.children[parts[-1]].size = size
+
+    @property
+    def paths(self) -> List[str]:
+        """All paths in sorted order"""
+        if not self._sorted:
+            self._paths.sort()
+            self._sorted = True
+        return self._paths
+
+    def lookup(self, path: str) -> Dict[str, Any] | None:
+        """Return the tree item for ``path`` or None"""
+        path = path.strip('/')
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        type_, size, sha = entry
+        return {'path': path, 'type': type_, 'size': size, 'sha': sha}
+
+    def node(self, path: str) -> TreeNode | None:
+        """Return the trie node for ``path`` ('' is the root)"""
+        node = self.root
+        for part in filter(None, path.strip('/').split('/')):
+            if node.children is None:
+                return None
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def list_dir(self, path: str = '') -> List[Dict[str, Any]] | None:
+        """Direct children of a directory, directories first, or None if missing"""
+        node = self.node(path)
+        if node is None or node.children is None:
+            return None
+        prefix = path.strip('/')
+        children = [
+            {
+                'name': name,
+                'path': f"{prefix}/{name}" if prefix else name,
+                'type': child.type,
+                'size': child.size,
+                'files': child.files,
+            }
+            for name, child in node.children.items()
+        ]
+        children.sort(key=lambda c: (c['type'] != 'tree', c['name']))
+        return children
+
+    def iter_prefix(self, prefix: str) -> Iterator[str]:
+        """Yield sorted paths under directory ``prefix``"""
+        paths = self.paths
+        prefix = prefix.strip('/')
+        if not prefix:
+            yield from paths
+            return
+        start = prefix + '/'
+        i = bisect.bisect_left(paths, start)
+        while i < len(paths) and paths[i].startswith(start):
+            yield paths[i]
+            i += 1
+
+    def glob(self, pattern: str) -> List[str]:
+        """Paths matching a glob.
+
+        ``*`` and ``?`` stay within one path segment and ``**`` spans
+        directories. A pattern without ``/`` matches file names at any depth,
+        so ``*.py`` finds every Python file.
+        """
+        pattern = pattern.strip().lstrip('/')
+        if '/' not in pattern:
+            regex = glob_to_regex(pattern)
+            return [p for p in self.paths if regex.fullmatch(p.rsplit('/', 1)[-1])]
+        regex = glob_to_regex(pattern)
+        literal = pattern
+        for i, c in enumerate(pattern):
+            if c in GLOB_CHARS:
+                literal = pattern[:i]
+                break
+        prefix = literal.rsplit('/', 1)[0] if '/' in literal else ''
+        return [p for p in self.iter_prefix(prefix) if regex.fullmatch(p)]
+
+    def patched(self, changes: Dict[str, Dict[str, Any] | None]) -> 'RepoTree':
+        """Copy of the tree with files added, replaced or (mapped to None) removed.
+
+        Directories are created for new files and dropped once empty. The
+        SHAs of directories above a change are cleared, since they are no
+        longer known.
+        """
+        entries = {path: entry for path, entry in self._entries.items() if entry[0] != 'tree'}
+        changed_dirs = set()
+        for path, item in changes.items():
+            entries.pop(path, None)
+            if item is not None:
+                entries[path] = (item.get('type', 'blob'), item.get('size') or 0, item.get('sha'))
+            parts = path.split('/')
+            changed_dirs.update('/'.join(parts[:i]) for i in range(1, len(parts)))
+        directories = {
+            '/'.join(parts[:i])
+            for parts in (path.split('/') for path in entries)
+            for i in range(1, len(parts))
+        }
+        for directory in directories:
+            old = self._entries.get(directory)
+            sha = old[2] if old is not None and directory not in changed_dirs else None
+            entries[directory] = ('tree', 0, sha)
+        tree = RepoTree(
+            {'path': path, 'type': type_, 'size': size, 'sha': sha}
+            for path, (type_, size, sha) in entries.items()
+        )
+        tree.complete = self.complete
+        return tree
+
+    def to_json(self) -> List[List[Any]]:
+        """Compact list form for persisting in the cache"""
+        return [[path, *self._entries[path]] for path in self.paths]
+
+    @classmethod
+    def from_json(cls, rows: List[List[Any]]) -> 'RepoTree':
+        return cls(
+            {'path': path, 'type': type_, 'size': size, 'sha': sha}
+            for path, type_, size, sha in rows
+        )
+
+
+def glob_to_regex(pattern: str) -> re.Pattern:
+    """Translate a path glob (with ``**``) into a compiled regex"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+            continue
+        if c == '*':
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return re.compile(''.join(out))
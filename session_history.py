@@ -0,0 +1,73 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+
+@dataclass
+class CachedSession:
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    # True when rows hold the session's entire history, not just its tail
+    complete: bool = False
+    last_used: float = 0.0
+
+
+class SessionHistoryCache:
+    """Bounded in-process cache of recent message rows per session.
+
+    Filled from the database on a miss and kept current by ``append`` as
+    this worker writes messages, so follow-up turns in a hot conversation
+    don't read the database at all. Holds at most ``max_sessions`` sessions
+    (least recently used are evicted first) and ``max_rows`` rows each, and
+    drops sessions idle for more than ``idle_ttl`` seconds. Writes made by
+    other workers are only picked up once the session expires here.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 1800, max_rows: int = 50):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_rows = max_rows
+        self._sessions: "OrderedDict[str, CachedSession]" = OrderedDict()
+
+    def get(self, session_id: str, limit: int) -> List[Dict[str, Any]] | None:
+        """The last ``limit`` rows of a session, or None if they aren't all cached"""
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if len(session.rows) < limit and not session.complete:
+            return None
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session.rows[-limit:]
+
+    def put(self, session_id: str, rows: List[Dict[str, Any]], complete: bool):
+        """Cache rows read from the database, oldest first"""
+        self._sessions[session_id] = CachedSession(
+            rows=list(rows[-self.max_rows:]),
+            complete=complete and len(rows) <= self.max_rows,
+            last_used=time.monotonic(),
+        )
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def append(self, session_id: str, row: Dict[str, Any]):
+        """Record a row this worker wrote; ignored for sessions not cached"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        session.rows.append(row)
+        if len(session.rows) > self.max_rows:
+            del session.rows[:-self.max_rows]
+            session.complete = False
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used > cutoff:
+                break
+            del self._sessions[session_id]
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that fetch the same resource.
+
+    The first caller for a key starts ``fn()`` as a task; everyone who asks
+    for the same key while it is running awaits that task instead of making
+    their own request. Once it finishes the key is forgotten, so later calls
+    start fresh (and normally hit a cache the first call filled).
+
+    The task is shielded from its callers: one of them being cancelled, for
+    example when a client disconnects, doesn't cancel the fetch for the rest.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def running(self, key: Hashable) -> asyncio.Task | None:
+        """The in-flight task for ``key`` on the current event loop, if any"""
+        task = self._tasks.get(key)
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return None
+        return task
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Return the in-flight task for ``key``, starting ``fn()`` if there is none"""
+        task = self.running(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``fn()``, sharing the call with concurrent callers for ``key``"""
+        return await asyncio.shield(self.start(key, fn))
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
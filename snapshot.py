@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import tarfile
+import zlib
+from typing import Any, Callable, Dict
+
+import httpx
+
+BLOCK = 512
+ZERO_BLOCK = bytes(BLOCK)
+FILE_TYPES = (tarfile.REGTYPE, tarfile.AREGTYPE, tarfile.CONTTYPE)
+
+
+class SnapshotError(Exception):
+    """The repository archive couldn't be downloaded or parsed"""
+
+
+class TarStreamParser:
+    """Incremental reader for GitHub's tarball format.
+
+    Bytes are pushed in with ``feed`` as they arrive and complete entries are
+    handed to ``on_entry`` one at a time, so only the member currently being
+    read is ever held in memory. Handles ustar, pax ('x'/'g') and GNU long
+    name headers. The leading ``owner-repo-sha/`` directory is stripped.
+
+    Each entry is a GitHub tree item (path, type, size, sha) where the sha of
+    a file is its git blob SHA, hashed while streaming, plus ``data`` with the
+    body, or None when the file is larger than ``max_file_bytes``.
+    """
+
+    def __init__(self, on_entry: Callable[[Dict[str, Any]], None], max_file_bytes: int):
+        self.on_entry = on_entry
+        self.max_file_bytes = max_file_bytes
+        self.done = False
+        self._buffer = bytearray()
+        self._member: tarfile.TarInfo | None = None
+        self._remaining = 0
+        self._padding = 0
+        self._hash = None
+        self._data: bytearray | None = None
+        self._pax: Dict[str, str] = {}
+        self._longname: str | None = None
+
+    def feed(self, chunk: bytes):
+        self._buffer += chunk
+        while not self.done:
+            if self._member is not None:
+                if not self._read_body():
+                    return
+            elif len(self._buffer) >= BLOCK:
+                header = bytes(self._buffer[:BLOCK])
+                del self._buffer[:BLOCK]
+                self._start_member(header)
+            else:
+                return
+
+    def _start_member(self, header: bytes):
+        if header == ZERO_BLOCK:
+            self.done = True
+            return
+        try:
+            member = tarfile.TarInfo.frombuf(header, 'utf-8', 'surrogateescape')
+        except tarfile.HeaderError as e:
+            raise SnapshotError(f"Invalid tar header: {e}") from e
+        if 'path' in self._pax:
+            member.name = self._pax['path']
+        if 'linkpath' in self._pax:
+            member.linkname = self._pax['linkpath']
+        if 'size' in self._pax:
+            member.size = int(self._pax['size'])
+        if self._longname is not None:
+            member.name = self._longname
+        if member.type not in (tarfile.XHDTYPE, tarfile.XGLTYPE, tarfile.GNUTYPE_LONGNAME):
+            self._pax = {}
+            self._longname = None
+
+        self._member = member
+        self._remaining = member.size
+        self._padding = -member.size % BLOCK
+        self._data = bytearray()
+        if member.type in FILE_TYPES:
+            self._hash = hashlib.sha1(f"blob {member.size}\0".encode())
+            if member.size > self.max_file_bytes:
+                self._data = None
+        else:
+            self._hash = None
+
+    def _read_body(self) -> bool:
+        """Consume as much of the current member as is buffered; True when finished"""
+        if self._remaining:
+            take = min(self._remaining, len(self._buffer))
+            piece = bytes(self._buffer[:take])
+            del self._buffer[:take]
+            self._remaining -= take
+            if self._hash is not None:
+                self._hash.update(piece)
+            if self._data is not None:
+                self._data += piece
+            if self._remaining:
+                return False
+        if len(self._buffer) < self._padding:
+            return False
+        del self._buffer[:self._padding]
+        member, data, digest = self._member, self._data, self._hash
+        self._member = self._data = self._hash = None
+        self._finish_member(member, data, digest)
+        return True
+
+    def _finish_member(self, member: tarfile.TarInfo, data: bytearray | None, digest):
+        if member.type == tarfile.XHDTYPE:
+            self._pax.update(parse_pax_records(bytes(data)))
+            return
+        if member.type == tarfile.XGLTYPE:
+            return
+        if member.type == tarfile.GNUTYPE_LONGNAME:
+            self._longname = bytes(data).rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            return
+
+        parts = member.name.strip('/').split('/', 1)
+        if len(parts) < 2 or not parts[1]:
+            return
+        path = parts[1]
+        if member.type == tarfile.DIRTYPE:
+            self.on_entry({'path': path, 'type': 'tree', 'size': 0, 'sha': None, 'data': None})
+        elif member.type == tarfile.SYMTYPE:
+            # git stores a symlink as a blob containing its target
+            target = member.linkname.encode('utf-8', 'surrogateescape')
+            sha = hashlib.sha1(f"blob {len(target)}\0".encode() + target).hexdigest()
+            self.on_entry({'path': path, 'type': 'blob', 'size': len(target), 'sha': sha, 'data': target})
+        elif member.type in FILE_TYPES:
+            self.on_entry({
+                'path': path,
+                'type': 'blob',
+                'size': member.size,
+                'sha': digest.hexdigest(),
+                'data': bytes(data) if data is not None else None,
+            })
+
+
+def parse_pax_records(data: bytes) -> Dict[str, str]:
+    """Parse 'length key=value\\n' pax extended header records"""
+    records = {}
+    pos = 0
+    while pos < len(data):
+        space = data.find(b' ', pos)
+        if space == -1:
+            break
+        length = int(data[pos:space])
+        if length <= 0:
+            break
+        record = data[space + 1:pos + length - 1]
+        key, _, value = record.partition(b'=')
+        records[key.decode('utf-8')] = value.decode('utf-8', 'surrogateescape')
+        pos += length
+    return records
+
+
+async def download_snapshot(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict,
+    on_entry: Callable[[Dict[str, Any]], None],
+    max_file_bytes: int,
+) -> int:
+    """Stream a .tar.gz archive from ``url`` through TarStreamParser.
+
+    The archive is decompressed and parsed chunk by chunk and never held in
+    memory as a whole. Parsing runs in a worker thread so hashing and storing
+    bodies doesn't block the event loop; ``on_entry`` is called from that
+    thread, one entry at a time. Returns the number of compressed bytes read.
+    """
+    parser = TarStreamParser(on_entry, max_file_bytes)
+
+    def feed(decompressor, chunk: bytes):
+        parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+
+    decompressor = None
+    received = 0
+    async with client.stream('GET', url, headers=headers, follow_redirects=True) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise SnapshotError(f"{response.status_code} {response.text[:200]}")
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if decompressor is None:
+                # Only gunzip if the server didn't already apply Content-Encoding
+                gzipped = chunk[:2] == b'\x1f\x8b'
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else False
+            await asyncio.to_thread(feed, decompressor, chunk)
+            if parser.done:
+                break
+    if not parser.done:
+        raise SnapshotError("Archive ended before the end-of-archive marker")
+    return received
+
@@ -0,0 +1,195 @@
+import heapq
+import math
+from typing import Dict, Iterable, List, Tuple
+
+from repo_tree import RepoTree, TreeNode, glob_to_regex
+
+# Rough characters-per-token ratio used to turn a token budget into a size limit
+CHARS_PER_TOKEN = 4
+
+DEFAULT_EXCLUDES = [
+    '.git/',
+    'node_modules/',
+    '__pycache__/',
+    '.venv/',
+    'venv/',
+    '.tox/',
+    '*.pyc',
+    '.DS_Store',
+]
+
+MANIFESTS = {
+    'pyproject.toml', 'setup.py', 'setup.cfg', 'requirements.txt', 'pipfile',
+    'package.json', 'tsconfig.json', 'cargo.toml', 'go.mod', 'gemfile',
+    'pom.xml', 'build.gradle', 'build.gradle.kts', 'makefile', 'cmakelists.txt',
+    'dockerfile', 'docker-compose.yml', 'docker-compose.yaml',
+}
+ENTRY_POINTS = {
+    'main.py', '__main__.py', 'app.py', 'cli.py', 'server.py', 'manage.py',
+    'index.js', 'index.ts', 'main.js', 'main.ts', 'main.go', 'main.rs',
+    'lib.rs', 'mod.rs', 'main.c', 'main.cpp', 'program.cs',
+}
+LOCKFILES = {
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock',
+    'cargo.lock', 'go.sum', 'pipfile.lock', 'gemfile.lock', 'composer.lock',
+}
+SOURCE_DIRS = {'src', 'lib', 'app', 'pkg', 'cmd', 'internal', 'core'}
+MINOR_DIRS = {'test', 'tests', 'docs', 'doc', 'examples', 'example', 'vendor', 'third_party', 'fixtures'}
+
+
+class ExcludeRules:
+    """Subset of .gitignore matching for hiding paths from structure output.
+
+    Supports ``#`` comments, ``!`` negation, a trailing ``/`` for directories
+    only, anchoring with a leading or inner ``/``, and ``*``/``?``/``**``
+    wildcards. As in git, the last matching rule wins.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.rules: List[Tuple[bool, bool, bool, object]] = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negate = pattern.startswith('!')
+            if negate:
+                pattern = pattern[1:]
+            dir_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            anchored = '/' in pattern
+            pattern = pattern.lstrip('/')
+            self.rules.append((negate, dir_only, anchored, glob_to_regex(pattern)))
+
+    def excluded(self, path: str, is_dir: bool) -> bool:
+        result = False
+        name = path.rsplit('/', 1)[-1]
+        for negate, dir_only, anchored, regex in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path if anchored else name):
+                result = not negate
+        return result
+
+
+def score_file(path: str, node: TreeNode) -> float:
+    """Relevance of a file for an overview: manifests, READMEs, entry points first"""
+    name = path.rsplit('/', 1)[-1].lower()
+    depth = path.count('/')
+    score = 0.0
+    if name.startswith('readme'):
+        score += 100 if depth == 0 else 40
+    elif name in MANIFESTS:
+        score += 80
+    elif name in ENTRY_POINTS:
+        score += 60
+    elif name.startswith(('license', 'contributing', 'changelog')):
+        score += 25
+    elif name in LOCKFILES:
+        score -= 30
+    elif name.startswith('.'):
+        score -= 10
+    score -= 8 * depth
+    # Bigger files usually carry more of the logic, but only mildly
+    score += min(10.0, math.log2(node.size + 1) / 2)
+    return score
+
+
+def score_dir(path: str, node: TreeNode) -> float:
+    """Priority for expanding a directory in the overview"""
+    name = path.rsplit('/', 1)[-1].lower()
+    depth = path.count('/')
+    score = 50.0 - 15 * depth
+    if name in SOURCE_DIRS:
+        score += 20
+    elif name in MINOR_DIRS:
+        score -= 15
+    if name.startswith('.'):
+        score -= 20
+    score += min(10.0, math.log2(node.files + 1))
+    return score
+
+
+def render_structure(
+    tree: RepoTree,
+    path: str = '',
+    max_tokens: int = 2000,
+    max_depth: int = 4,
+    excludes: Iterable[str] | None = None,
+    max_entries_per_dir: int = 25,
+) -> str | None:
+    """Render a bounded, ranked overview of a repository tree.
+
+    Directories are expanded best-first (source directories and shallow ones
+    before tests, docs and dot-directories) until the token budget or
+    ``max_depth`` is reached; the rest are shown collapsed with file counts.
+    Inside each directory at most ``max_entries_per_dir`` of the most relevant
+    entries are listed and the remainder summarized, so no single directory
+    crowds out the rest and output size stays bounded for any repo size.
+    Returns None if ``path`` is not a directory.
+    """
+    root_path = path.strip('/')
+    root = tree.node(root_path)
+    if root is None or root.children is None:
+        return None
+    rules = ExcludeRules(DEFAULT_EXCLUDES + list(excludes or []))
+    budget = max_tokens * CHARS_PER_TOKEN
+    used = 0
+    shown: Dict[str, Tuple[List[Tuple[str, str, TreeNode]], int, int]] = {}
+
+    def full(parent: str, name: str) -> str:
+        return f"{parent}/{name}" if parent else name
+
+    def line(name: str, node: TreeNode, depth: int) -> str:
+        indent = '  ' * depth
+        if node.children is not None:
+            return f"{indent}📁 {name}/ ({node.files} files)"
+        return f"{indent}📄 {name}"
+
+    heap = [(0.0, root_path, root, 0)]
+    while heap:
+        _, dir_path, dir_node, depth = heapq.heappop(heap)
+        children = [
+            (name, full(dir_path, name), child)
+            for name, child in dir_node.children.items()
+            if not rules.excluded(full(dir_path, name), child.children is not None)
+        ]
+        ranked = sorted(
+            children,
+            key=lambda c: -(score_dir(c[1], c[2]) if c[2].children is not None else score_file(c[1], c[2])),
+        )
+        chosen = []
+        for name, child_path, child in ranked[:max_entries_per_dir]:
+            cost = len(line(name, child, depth)) + 1
+            if used + cost > budget:
+                break
+            chosen.append((name, child_path, child))
+            used += cost
+        if not chosen and dir_path != root_path:
+            # Nothing fits; leave it collapsed with its file count
+            continue
+        omitted = len(ranked) - len(chosen)
+        omitted_files = sum(1 if c.children is None else c.files for _, _, c in ranked[len(chosen):])
+        if omitted:
+            used += 40
+        shown[dir_path] = (chosen, omitted, omitted_files)
+        if used >= budget or depth + 1 >= max_depth:
+            continue
+        for name, child_path, child in chosen:
+            if child.children is not None and child.children:
+                heapq.heappush(heap, (-score_dir(child_path, child), child_path, child, depth + 1))
+
+    lines: List[str] = []
+
+    def emit(dir_path: str, depth: int):
+        chosen, omitted, omitted_files = shown[dir_path]
+        for name, child_path, child in sorted(chosen, key=lambda c: (c[2].children is None, c[0])):
+            if child.children is not None and child_path in shown:
+                lines.append(f"{'  ' * depth}📁 {name}/")
+                emit(child_path, depth + 1)
+            else:
+                lines.append(line(name, child, depth))
+        if omitted:
+            lines.append(f"{'  ' * depth}… {omitted} more entries ({omitted_files} files)")
+
+    emit(root_path, 0)
+    return "\n".join(lines)
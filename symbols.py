@@ -0,0 +1,226 @@
+import ast
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Bump when extractors change so cached symbol tables are rebuilt
+SYMBOLS_VERSION = 1
+MAX_SIGNATURE_CHARS = 200
+MAX_DOC_CHARS = 100
+
+
+@dataclass
+class Symbol:
+    """A definition or import found in a source file"""
+    kind: str  # class, function, method, field, constant, import, interface, type, enum
+    name: str
+    line: int
+    signature: str
+    # Qualified name of the enclosing class, if any
+    parent: str | None = None
+    # First line of the docstring
+    doc: str | None = None
+
+    @property
+    def qualname(self) -> str:
+        return f"{self.parent}.{self.name}" if self.parent else self.name
+
+    def to_json(self) -> list:
+        return [self.kind, self.name, self.line, self.signature, self.parent, self.doc]
+
+    @classmethod
+    def from_json(cls, data: list) -> 'Symbol':
+        return cls(*data)
+
+
+@dataclass
+class SymbolTable:
+    """Symbols of every supported file at one commit"""
+    files: Dict[str, List[Symbol]] = field(default_factory=dict)
+    # Blob SHA each file's symbols came from, so the next commit can reuse them
+    blobs: Dict[str, str] = field(default_factory=dict)
+    # Source files left out because the repo was over the file cap
+    skipped: int = 0
+
+    def find(self, name: str, kind: str | None = None) -> List[Tuple[str, Symbol]]:
+        """(path, symbol) pairs matching ``name``, exact matches first.
+
+        Matching is case-insensitive against the name and the qualified name
+        (``Class.method``); partial matches follow the exact ones. Imports
+        are only returned when ``kind`` is 'import'.
+        """
+        query = name.lower()
+        exact, partial = [], []
+        for path in sorted(self.files):
+            for symbol in self.files[path]:
+                if kind is not None and symbol.kind != kind:
+                    continue
+                if kind is None and symbol.kind == 'import':
+                    continue
+                qualname = symbol.qualname.lower()
+                if query in (symbol.name.lower(), qualname):
+                    exact.append((path, symbol))
+                elif query in qualname:
+                    partial.append((path, symbol))
+        return exact + partial
+
+
+Extractor = Callable[[str], List[Symbol]]
+
+# File extension -> (language, extractor)
+_extractors: Dict[str, Tuple[str, Extractor]] = {}
+
+
+def register_extractor(language: str, *extensions: str):
+    """Register a function turning source text into symbols for these extensions"""
+    def decorator(extractor: Extractor) -> Extractor:
+        for extension in extensions:
+            _extractors[extension] = (language, extractor)
+        return extractor
+    return decorator
+
+
+def language_for(path: str) -> str | None:
+    """Name of the extractor that handles ``path``, or None if there is none"""
+    found = _extractors.get(Path(path).suffix.lower())
+    return found[0] if found else None
+
+
+def extract_symbols(path: str, text: str) -> List[Symbol]:
+    """Symbols defined in a file; empty if its language isn't supported or it doesn't parse"""
+    found = _extractors.get(Path(path).suffix.lower())
+    if found is None:
+        return []
+    try:
+        return found[1](text)
+    except (SyntaxError, ValueError, RecursionError) as e:
+        print(f"Could not extract symbols from {path}: {str(e)}")
+        return []
+
+
+def _clip(text: str, limit: int) -> str:
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+@register_extractor('python', '.py', '.pyi')
+def python_symbols(text: str) -> List[Symbol]:
+    """Classes, functions, methods, class fields, module constants and imports"""
+    symbols = []
+
+    def doc(node) -> str | None:
+        docstring = ast.get_docstring(node, clean=True)
+        return _clip(docstring.splitlines()[0], MAX_DOC_CHARS) if docstring else None
+
+    def function(node, parent: str | None):
+        decorators = ''.join(f"@{ast.unparse(d)} " for d in node.decorator_list)
+        prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+        signature = f"{decorators}{prefix} {node.name}({ast.unparse(node.args)})"
+        if node.returns is not None:
+            signature += f" -> {ast.unparse(node.returns)}"
+        symbols.append(Symbol(
+            'method' if parent else 'function', node.name, node.lineno,
+            _clip(signature, MAX_SIGNATURE_CHARS), parent, doc(node),
+        ))
+
+    def visit(body: List[ast.stmt], parent: str | None):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                function(node, parent)
+            elif isinstance(node, ast.ClassDef):
+                decorators = ''.join(f"@{ast.unparse(d)} " for d in node.decorator_list)
+                bases = [ast.unparse(b) for b in node.bases] + [ast.unparse(k) for k in node.keywords]
+                signature = f"{decorators}class {node.name}" + (f"({', '.join(bases)})" if bases else '')
+                symbols.append(Symbol(
+                    'class', node.name, node.lineno,
+                    _clip(signature, MAX_SIGNATURE_CHARS), parent, doc(node),
+                ))
+                visit(node.body, f"{parent}.{node.name}" if parent else node.name)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)) and parent is None:
+                for alias in node.names:
+                    name = alias.asname or alias.name
+                    symbols.append(Symbol('import', name, node.lineno, _clip(ast.unparse(node), MAX_SIGNATURE_CHARS)))
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                if parent is not None or node.target.id.isupper():
+                    symbols.append(Symbol(
+                        'field' if parent else 'constant', node.target.id, node.lineno,
+                        _clip(ast.unparse(node), MAX_SIGNATURE_CHARS), parent,
+                    ))
+            elif isinstance(node, ast.Assign) and parent is None:
+                for target in node.targets:
+                    if isinstance(target, ast.Name) and target.id.isupper():
+                        symbols.append(Symbol(
+                            'constant', target.id, node.lineno,
+                            _clip(ast.unparse(node), MAX_SIGNATURE_CHARS),
+                        ))
+            elif isinstance(node, (ast.If, ast.Try)) and parent is None:
+                # Conditional imports and definitions at module level
+                visit(node.body, parent)
+                visit(node.orelse, parent)
+                for handler in getattr(node, 'handlers', []):
+                    visit(handler.body, parent)
+
+    visit(ast.parse(text).body, None)
+    return symbols
+
+
+_JS_PATTERNS = [
+    ('function', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)')),
+    ('class', re.compile(r'^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+([A-Za-z_$][\w$]*)')),
+    ('function', re.compile(
+        r'^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*(?:async\s+)?'
+        r'(?:function\b|(?:\([^)]*\)|[A-Za-z_$][\w$]*)\s*(?::[^=]+)?=>)'
+    )),
+    ('interface', re.compile(r'^\s*(?:export\s+)?(?:declare\s+)?interface\s+([A-Za-z_$][\w$]*)')),
+    ('type', re.compile(r'^\s*(?:export\s+)?(?:declare\s+)?type\s+([A-Za-z_$][\w$]*)\s*(?:<[^=]*>)?\s*=')),
+    ('enum', re.compile(r'^\s*(?:export\s+)?(?:declare\s+)?(?:const\s+)?enum\s+([A-Za-z_$][\w$]*)')),
+    ('import', re.compile(r'''^\s*import\s+(?:.+?\s+from\s+)?['"]([^'"]+)['"]''')),
+]
+_JS_METHOD = re.compile(
+    r'^\s+(?:(?:public|private|protected|static|readonly|async|get|set)\s+)*'
+    r'(#?[A-Za-z_$][\w$]*)\s*(?:<[^>]*>)?\s*\([^)]*\)?\s*(?::[^{]+)?\{?\s*$'
+)
+_JS_KEYWORDS = {'if', 'for', 'while', 'switch', 'catch', 'with', 'return', 'function', 'else'}
+
+
+@register_extractor('javascript', '.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx', '.mts', '.cts')
+def javascript_symbols(text: str) -> List[Symbol]:
+    """Top-level declarations, imports and class methods, matched line by line.
+
+    A regex pass rather than a parser, so it misses unusual formatting, but it
+    needs no dependencies and handles both JavaScript and TypeScript.
+    """
+    symbols = []
+    current_class, class_indent = None, 0
+    for number, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(('//', '*', '/*')):
+            continue
+        indent = len(line) - len(line.lstrip())
+        if current_class and indent <= class_indent:
+            current_class = None
+        signature = _clip(stripped.rstrip('{').rstrip(), MAX_SIGNATURE_CHARS)
+        for kind, pattern in _JS_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                symbols.append(Symbol(kind, match.group(1), number, signature))
+                if kind == 'class':
+                    current_class, class_indent = match.group(1), indent
+                break
+        else:
+            if current_class:
+                match = _JS_METHOD.match(line)
+                if match and match.group(1) not in _JS_KEYWORDS:
+                    symbols.append(Symbol('method', match.group(1), number, signature, current_class))
+    return symbols
+
+
+def format_symbol(symbol: Symbol, path: str | None = None) -> str:
+    """One line for tool output, e.g. ``pkg/app.py:12: def run(self) -> None  (in App)``"""
+    line = f"{path}:{symbol.line}: {symbol.signature}" if path else f"{symbol.line}: {symbol.signature}"
+    if symbol.parent and path:
+        line += f"  (in {symbol.parent})"
+    if symbol.doc:
+        line += f"  # {symbol.doc}"
+    return line
@@ -69,9 +69,61 @@ async def test_github_agent():
             print("\nWaiting 2 seconds before next request...")
             await asyncio.sleep(2)
 
+async def test_github_agent_stream():
+    # Load environment variables
+    load_dotenv()
+    bearer_token = os.getenv('BEARER_TOKEN')
+    if not bearer_token:
+        print("ERROR: BEARER_TOKEN not set in .env")
+        return
+
+    print(f"\n{'='*50}")
+    print("Running test: Streaming Repository Query")
+    print(f"{'='*50}")
+
+    payload = {
+        "query": "Tell me about https://github.com/openai/openai-python",
+        "user_id": "test_user",
+        "request_id": f"test_stream_{int(datetime.now().timestamp())}",
+        "session_id": "test_session_stream"
+    }
+    headers = {
+        "Authorization": f"Bearer {bearer_token}",
+        "Content-Type": "application/json"
+    }
+
+    async with httpx.AsyncClient() as client:
+        try:
+            start = datetime.now()
+            first_event = None
+            async with client.stream(
+                "POST",
+                "http://localhost:8000/api/pydantic-github-agent/stream",
+                headers=headers,
+                json=payload,
+                timeout=120.0
+            ) as response:
+                print(f"Status: {response.status_code}")
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                        if first_event is None:
+                            first_event = (datetime.now() - start).total_seconds()
+                            print(f"Time to first event: {first_event:.2f}s")
+                    elif line.startswith("data: ") and event != "token":
+                        print(f"[{event}] {line[len('data: '):][:200]}")
+                    elif line.startswith("data: "):
+                        print(json.loads(line[len("data: "):])["text"], end="", flush=True)
+            print(f"\nTotal time: {(datetime.now() - start).total_seconds():.2f}s")
+        except Exception as e:
+            print(f"\nError during streaming test: {str(e)}")
+            print(f"Error type: {type(e)}")
+
 if __name__ == "__main__":
     print("Checking if server is running...")
     print("Starting tests in 3 seconds...")
     asyncio.run(asyncio.sleep(3))
     
-    asyncio.run(test_github_agent())
\ No newline at end of file
+    asyncio.run(test_github_agent())
+    asyncio.run(test_github_agent_stream())
\ No newline at end of file
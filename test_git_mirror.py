@@ -0,0 +1,176 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from blob_store import git_blob_sha
+from git_mirror import GitError, GitMirrorPool
+from github_deps import GitHubDeps
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ['git', *args], cwd=cwd, check=True, capture_output=True, text=True,
+        env={**os.environ, 'GIT_AUTHOR_NAME': 't', 'GIT_AUTHOR_EMAIL': 't@t',
+             'GIT_COMMITTER_NAME': 't', 'GIT_COMMITTER_EMAIL': 't@t'},
+    ).stdout.strip()
+
+
+def make_origin(root: Path) -> Path:
+    """A local 'owner/repo' with two files, serving partial clones over file://"""
+    origin = root / 'origin' / 'owner' / 'repo'
+    origin.mkdir(parents=True)
+    git(origin, 'init', '-q', '-b', 'main')
+    # Partial clones and on-demand blob fetches need these on the server side
+    git(origin, 'config', 'uploadpack.allowFilter', 'true')
+    git(origin, 'config', 'uploadpack.allowAnySHA1InWant', 'true')
+    (origin / 'README.md').write_text('# Demo\n')
+    (origin / 'src').mkdir()
+    (origin / 'src' / 'main.py').write_text('def main():\n    pass\n')
+    git(origin, 'add', '.')
+    git(origin, 'commit', '-q', '-m', 'initial')
+    return origin
+
+
+def pool_for(root: Path, **kwargs) -> GitMirrorPool:
+    return GitMirrorPool(
+        str(root / 'mirrors'),
+        url_template=f"file://{root / 'origin'}/{{owner}}/{{repo}}",
+        **kwargs,
+    )
+
+
+def test_clone_list_and_read():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        origin = make_origin(root)
+        pool = pool_for(root)
+
+        async def run():
+            path = await pool.ensure('owner', 'repo')
+            ref = await pool.resolve_head(path)
+            assert ref == {'branch': 'main', 'sha': git(origin, 'rev-parse', 'HEAD')}
+            items = {item['path']: item for item in await pool.list_tree(path, ref['sha'])}
+            assert items['src']['type'] == 'tree'
+            data = await pool.read_blob(path, items['README.md']['sha'])
+            assert data == b'# Demo\n'
+            assert git_blob_sha(data) == items['README.md']['sha']
+
+        asyncio.run(run())
+
+
+def test_listing_does_not_fetch_blobs():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_origin(root)
+        pool = pool_for(root)
+
+        async def run():
+            path = await pool.ensure('owner', 'repo')
+            sha = (await pool.resolve_head(path))['sha']
+            items = await pool.list_tree(path, sha)
+            blobs = {item['sha'] for item in items if item['type'] == 'blob'}
+            missing = {
+                line[1:] for line in git(path, 'rev-list', '--objects', '--all', '--missing=print').splitlines()
+                if line.startswith('?')
+            }
+            assert blobs and blobs <= missing
+            assert all(item['size'] == 0 for item in items)
+            # Once read, a blob's size is known
+            readme = next(item for item in items if item['path'] == 'README.md')
+            await pool.read_blob(path, readme['sha'])
+            sizes = {item['path']: item['size'] for item in await pool.list_tree(path, sha)}
+            assert sizes['README.md'] == len('# Demo\n') and sizes['src/main.py'] == 0
+
+        asyncio.run(run())
+
+
+def test_fetch_picks_up_new_commits():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        origin = make_origin(root)
+        pool = pool_for(root, fetch_interval=0)
+
+        async def run():
+            path = await pool.ensure('owner', 'repo')
+            old = (await pool.resolve_head(path))['sha']
+            (origin / 'NEW.md').write_text('new\n')
+            git(origin, 'add', '.')
+            git(origin, 'commit', '-q', '-m', 'second')
+            await pool.ensure('owner', 'repo')
+            new = (await pool.resolve_head(path))['sha']
+            assert new != old and new == git(origin, 'rev-parse', 'HEAD')
+            assert 'NEW.md' in {item['path'] for item in await pool.list_tree(path, new)}
+
+        asyncio.run(run())
+
+
+def test_evicts_least_recently_used():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_origin(root)
+        other = root / 'origin' / 'owner' / 'other'
+        git(root, 'clone', '-q', '--bare', str(root / 'origin' / 'owner' / 'repo'), str(other))
+        git(other, 'config', 'uploadpack.allowFilter', 'true')
+        pool = pool_for(root, max_disk_bytes=1)
+
+        async def run():
+            first = await pool.ensure('owner', 'repo')
+            second = await pool.ensure('owner', 'other')
+            assert second.exists() and not first.exists()
+
+        asyncio.run(run())
+
+
+def test_slow_commands_are_killed():
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = pool_for(Path(tmp), timeout=0.2)
+
+        async def run():
+            try:
+                await pool._git('-c', 'alias.hang=!sleep 5', 'hang')
+            except GitError as e:
+                assert 'timed out' in str(e)
+            else:
+                raise AssertionError("hung command returned")
+
+        started = time.monotonic()
+        asyncio.run(run())
+        assert time.monotonic() - started < 2
+
+
+def test_deps_serve_tree_and_files_without_api():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_origin(root)
+
+        def no_api(request):
+            raise AssertionError(f"unexpected request to {request.url}")
+
+        async def run():
+            deps = GitHubDeps(
+                client=httpx.AsyncClient(transport=httpx.MockTransport(no_api)),
+                github_tokens=[],
+                git_mirrors=True,
+                _cache_file=str(root / 'cache.db'),
+                _blob_dir=str(root / 'blobs'),
+                _mirror_dir=str(root / 'mirrors'),
+            )
+            deps._mirrors.url_template = f"file://{root / 'origin'}/{{owner}}/{{repo}}"
+            tree = await deps.get_tree('owner', 'repo')
+            assert tree.lookup('src/main.py')['type'] == 'blob'
+            assert await deps.get_file_bytes('owner', 'repo', 'src/main.py') == b'def main():\n    pass\n'
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("Starting git mirror tests...")
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
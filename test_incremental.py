@@ -0,0 +1,135 @@
+import asyncio
+import tempfile
+from pathlib import Path
+
+import httpx
+
+from blob_store import git_blob_sha
+from github_deps import MAX_COMPARE_FILES, GitHubDeps
+from repo_tree import RepoTree
+
+OLD = 'a' * 40
+NEW = 'b' * 40
+
+
+def blob(path: str, data: bytes) -> dict:
+    return {'path': path, 'type': 'blob', 'size': len(data), 'sha': git_blob_sha(data)}
+
+
+def old_tree() -> RepoTree:
+    tree = RepoTree([
+        {'path': 'README.md', 'type': 'blob', 'size': 7, 'sha': 'r1'},
+        {'path': 'src', 'type': 'tree', 'sha': 'd-src'},
+        {'path': 'src/app.py', 'type': 'blob', 'size': 10, 'sha': 'a1'},
+        {'path': 'src/util', 'type': 'tree', 'sha': 'd-util'},
+        {'path': 'src/util/io.py', 'type': 'blob', 'size': 5, 'sha': 'i1'},
+        {'path': 'docs', 'type': 'tree', 'sha': 'd-docs'},
+        {'path': 'docs/index.md', 'type': 'blob', 'size': 3, 'sha': 'x1'},
+    ])
+    tree.complete = True
+    return tree
+
+
+def test_patched_adds_replaces_and_removes():
+    old = old_tree()
+    tree = old.patched({
+        # Rename within src/util: old path removed, new one added
+        'src/util/io.py': None,
+        'src/util/files.py': {'type': 'blob', 'size': 6, 'sha': 'i2'},
+        'docs/index.md': None,
+        'lib/new/mod.py': {'type': 'blob', 'size': 4, 'sha': 'n1'},
+        'README.md': {'type': 'blob', 'size': 8, 'sha': 'r2'},
+    })
+    assert tree.complete
+    assert tree.lookup('src/util/io.py') is None
+    assert tree.lookup('src/util/files.py')['sha'] == 'i2'
+    assert tree.lookup('README.md') == {'path': 'README.md', 'type': 'blob', 'size': 8, 'sha': 'r2'}
+    # Emptied directories go, new ones are created
+    assert tree.lookup('docs') is None
+    assert tree.lookup('lib')['type'] == 'tree' and tree.lookup('lib/new')['type'] == 'tree'
+    # Directories above a change lose their SHA; untouched ones keep it
+    assert tree.lookup('src')['sha'] is None and tree.lookup('src/util')['sha'] is None
+    assert tree.lookup('src/app.py')['sha'] == 'a1'
+    assert [e['path'] for e in tree.list_dir('src')] == [e['path'] for e in old.list_dir('src')]
+    # The original is left alone
+    assert old.lookup('src/util/io.py')['sha'] == 'i1' and old.lookup('src')['sha'] == 'd-src'
+
+
+def test_patched_keeps_untouched_directory_shas():
+    old = old_tree()
+    tree = old.patched({'docs/index.md': {'type': 'blob', 'size': 4, 'sha': 'x2'}})
+    assert tree.lookup('docs')['sha'] is None
+    assert tree.lookup('src')['sha'] == 'd-src' and tree.lookup('src/util')['sha'] == 'd-util'
+    assert len(tree) == len(old)
+
+
+def run_patch(compare: dict, files: dict | None = None) -> tuple:
+    """patch_tree OLD -> NEW against a mocked compare; returns (tree, request paths)"""
+    files = files or {}
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        if request.url.path == f'/repos/o/r/compare/{OLD}...{NEW}':
+            return httpx.Response(200, json=compare)
+        path = request.url.path.removeprefix(f'/o/r/{NEW}/')
+        if path in files:
+            return httpx.Response(200, content=files[path])
+        return httpx.Response(404)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+
+        async def run():
+            deps = GitHubDeps(
+                client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+                github_tokens=[],
+                _cache_file=str(root / 'cache.db'),
+                _blob_dir=str(root / 'blobs'),
+            )
+            deps.save_to_cache(f"tree_o_r_{OLD}", old_tree().to_json())
+            deps.record_head('o', 'r', OLD)
+            return await deps.patch_tree('o', 'r', NEW)
+
+        return asyncio.run(run()), requests
+
+
+def test_patch_tree_downloads_only_changed_files():
+    files = {'src/app.py': b'print("v2")\n', 'src/util/files.py': b'hello'}
+    compare = {'status': 'ahead', 'files': [
+        {'filename': 'src/app.py', 'status': 'modified', 'sha': git_blob_sha(files['src/app.py'])},
+        {'filename': 'src/util/files.py', 'previous_filename': 'src/util/io.py',
+         'status': 'renamed', 'sha': git_blob_sha(files['src/util/files.py'])},
+        {'filename': 'docs/index.md', 'status': 'removed', 'sha': 'x1'},
+    ]}
+    tree, requests = run_patch(compare, files)
+    assert tree.lookup('src/app.py') == blob('src/app.py', files['src/app.py'])
+    assert tree.lookup('src/util/io.py') is None
+    assert tree.lookup('src/util/files.py')['size'] == 5
+    assert tree.lookup('docs') is None
+    assert tree.lookup('README.md')['sha'] == 'r1'
+    assert sorted(requests) == sorted([
+        f'/repos/o/r/compare/{OLD}...{NEW}', f'/o/r/{NEW}/src/app.py', f'/o/r/{NEW}/src/util/files.py',
+    ])
+
+
+def test_patch_tree_falls_back_when_it_cannot_patch():
+    # Force-pushed: the new commit doesn't descend from the old one
+    tree, requests = run_patch({'status': 'diverged', 'files': []})
+    assert tree is None and len(requests) == 1
+    # Too many changes for the compare to list them all
+    many = [{'filename': f'f{i}', 'status': 'added', 'sha': str(i)} for i in range(MAX_COMPARE_FILES)]
+    tree, requests = run_patch({'status': 'ahead', 'files': many})
+    assert tree is None and len(requests) == 1
+    # A changed file that can't be downloaded
+    missing = [{'filename': 'src/app.py', 'status': 'modified', 'sha': git_blob_sha(b'x')}]
+    tree, _ = run_patch({'status': 'ahead', 'files': missing})
+    assert tree is None
+
+
+if __name__ == "__main__":
+    print("Starting incremental refresh tests...")
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,106 @@
+import asyncio
+
+from message_writer import MessageWriter, merge_pending
+
+
+class FakeTable:
+    """Stands in for supabase's table(...).insert(rows).execute() chain"""
+
+    def __init__(self, failures: int = 0):
+        self.batches = []
+        self.failures = failures
+        self._rows = None
+
+    def table(self, name):
+        return self
+
+    def insert(self, rows):
+        self._rows = rows
+        return self
+
+    async def execute(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("down")
+        self.batches.append(list(self._rows))
+
+
+def test_batches_by_size_and_interval():
+    async def run():
+        client = FakeTable()
+        writer = MessageWriter(client, batch_size=3, flush_interval=0.05)
+        writer.start()
+        for i in range(7):
+            await writer.write({"session_id": "s", "n": i})
+        await asyncio.sleep(0.2)
+        assert [len(b) for b in client.batches] == [3, 3, 1]
+        assert writer.pending_for("s") == []
+        await writer.close()
+
+    asyncio.run(run())
+
+
+def test_pending_rows_are_readable_until_written():
+    async def run():
+        client = FakeTable()
+        writer = MessageWriter(client, batch_size=10, flush_interval=10)
+        writer.start()
+        await writer.write({"session_id": "a", "n": 1})
+        await writer.write({"session_id": "b", "n": 2})
+        await asyncio.sleep(0)
+        assert [r["n"] for r in writer.pending_for("a")] == [1]
+        assert writer.pending_for("a")[0]["created_at"]
+        await writer.close()
+        assert writer.pending_for("a") == []
+
+    asyncio.run(run())
+
+
+def test_close_flushes_without_waiting_for_the_interval():
+    async def run():
+        client = FakeTable()
+        writer = MessageWriter(client, batch_size=2, flush_interval=60)
+        writer.start()
+        for i in range(5):
+            await writer.write({"session_id": "s", "n": i})
+        await asyncio.wait_for(writer.close(), timeout=1)
+        assert [r["n"] for b in client.batches for r in b] == [0, 1, 2, 3, 4]
+
+    asyncio.run(run())
+
+
+def test_retries_then_drops_a_failing_batch():
+    async def run():
+        client = FakeTable(failures=2)
+        writer = MessageWriter(client, batch_size=1, flush_interval=0, max_retries=2, retry_delay=0.001)
+        writer.start()
+        await writer.write({"session_id": "s", "n": 1})
+        await writer.close()
+        assert [len(b) for b in client.batches] == [1]
+
+        client = FakeTable(failures=5)
+        writer = MessageWriter(client, batch_size=1, flush_interval=0, max_retries=1, retry_delay=0.001)
+        writer.start()
+        await writer.write({"session_id": "s", "n": 1})
+        await writer.close()
+        assert client.batches == [] and writer.pending_for("s") == []
+
+    asyncio.run(run())
+
+
+def test_merge_pending_skips_rows_already_stored():
+    stored = [{"created_at": "2024-01-01T00:00:00+00:00", "n": 1}]
+    pending = [
+        {"created_at": "2024-01-01T00:00:00.000000+00:00", "n": 1},
+        {"created_at": "2024-01-01T00:00:01+00:00", "n": 2},
+    ]
+    assert [r["n"] for r in merge_pending(stored, pending, limit=10)] == [1, 2]
+    assert [r["n"] for r in merge_pending(stored, pending, limit=1)] == [2]
+
+
+if __name__ == "__main__":
+    print("Starting message writer tests...")
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
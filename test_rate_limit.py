@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import httpx
+
+from rate_limit import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    SECONDARY_BACKOFF,
+    RateLimitExceeded,
+    TokenPool,
+)
+
+
+def response(status: int = 200, text: str = '', **headers) -> httpx.Response:
+    return httpx.Response(status, text=text, headers={k.replace('_', '-'): v for k, v in headers.items()})
+
+
+def quota(remaining: int, limit: int = 5000, reset: float | None = None, resource: str = 'core') -> dict:
+    return {
+        'X_RateLimit_Remaining': str(remaining),
+        'X_RateLimit_Limit': str(limit),
+        'X_RateLimit_Reset': str(int(reset or time.time() + 3600)),
+        'X_RateLimit_Resource': resource,
+    }
+
+
+def test_release_tracks_quota_per_resource():
+    async def run():
+        pool = TokenPool(['a'])
+        state = await pool.acquire()
+        assert state.bucket('core').in_flight == 1
+        assert pool.release(state, 'core', response(**quota(41, resource='core'))) is None
+        state = await pool.acquire('graphql')
+        pool.release(state, 'graphql', response(**quota(7, resource='graphql')))
+        assert state.bucket('core').remaining == 41
+        assert state.bucket('graphql').remaining == 7
+        assert state.in_flight == 0 and state.bucket('core').in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_calls_go_to_the_token_with_most_quota():
+    async def run():
+        pool = TokenPool(['a', 'b'])
+        pool.release(await pool.acquire(), 'core', response(**quota(100)))
+        # Whichever token answered now has 100 left; the other still 5000
+        first = await pool.acquire()
+        assert first.bucket('core').remaining == 5000
+        pool.release(first, 'core')
+
+    asyncio.run(run())
+
+
+def test_primary_limit_and_low_priority_reserve():
+    async def run():
+        pool = TokenPool(['a'], reserve=0.1, max_wait=0)
+        state = pool.tokens[0]
+        limited = pool.release(await pool.acquire(), 'core', response(403, **quota(0)))
+        assert limited == 'primary'
+        try:
+            await pool.acquire()
+        except RateLimitExceeded:
+            pass
+        else:
+            raise AssertionError("acquired a spent token")
+
+        # 300 of 5000 left: interactive calls may use it, bulk ones wait
+        state.bucket('core').remaining = 300
+        pool.release(await pool.acquire(priority=PRIORITY_HIGH), 'core')
+        try:
+            await pool.acquire(priority=PRIORITY_LOW)
+        except RateLimitExceeded:
+            pass
+        else:
+            raise AssertionError("low priority call ate into the reserve")
+
+    asyncio.run(run())
+
+
+def test_quota_comes_back_after_reset():
+    async def run():
+        pool = TokenPool(['a'], max_wait=3)
+        reset = int(time.time()) + 1
+        pool.release(await pool.acquire(), 'core', response(**quota(0, reset=reset)))
+        state = await pool.acquire()
+        assert time.time() >= reset
+        assert state.bucket('core').remaining == state.bucket('core').limit
+
+    asyncio.run(run())
+
+
+def test_secondary_limits_block_the_token():
+    async def run():
+        pool = TokenPool(['a'])
+        state = pool.tokens[0]
+        assert pool.release(await pool.acquire(), 'core', response(429, Retry_After='30')) == 'secondary'
+        assert 29 < state.blocked_until - time.time() <= 30
+
+        state.blocked_until = 0
+        text = 'You have exceeded a secondary rate limit'
+        assert pool.release(await pool.acquire(), 'core', response(403, text=text, **quota(10))) == 'secondary'
+        assert state.backoff == SECONDARY_BACKOFF
+        state.blocked_until = 0
+        pool.release(await pool.acquire(), 'core', response(403, text=text, **quota(10)))
+        assert state.backoff == SECONDARY_BACKOFF * 2
+        # Any other response resets the backoff
+        state.blocked_until = 0
+        pool.release(await pool.acquire(), 'core', response(200, **quota(9)))
+        assert state.backoff == 0
+
+        # A plain 403 (no access) is not a rate limit
+        assert pool.release(await pool.acquire(), 'core', response(403, text='Forbidden', **quota(8))) is None
+
+    asyncio.run(run())
+
+
+def test_anonymous_requests_use_their_own_quota():
+    async def run():
+        pool = TokenPool(['a'])
+        state = await pool.acquire(authenticated=False)
+        assert state is pool.anonymous and state.bucket('core').limit == 60
+        pool.release(state, 'core', response(**quota(59, limit=60)))
+        assert pool.tokens[0].bucket('core').remaining == 5000
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("Starting rate limit tests...")
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,120 @@
+import asyncio
+import gzip
+import io
+import os
+import subprocess
+import tarfile
+import tempfile
+from pathlib import Path
+
+import httpx
+
+from blob_store import git_blob_sha
+from snapshot import SnapshotError, TarStreamParser, download_snapshot
+
+
+def git(cwd, *args) -> bytes:
+    return subprocess.run(
+        ['git', *args], cwd=cwd, check=True, capture_output=True,
+        env={**os.environ, 'GIT_AUTHOR_NAME': 't', 'GIT_AUTHOR_EMAIL': 't@t',
+             'GIT_COMMITTER_NAME': 't', 'GIT_COMMITTER_EMAIL': 't@t'},
+    ).stdout
+
+
+def make_tar(files: dict, format=tarfile.PAX_FORMAT, symlinks: dict | None = None) -> bytes:
+    """An uncompressed archive laid out like GitHub's, under owner-repo-sha/"""
+    symlinks = symlinks or {}
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w', format=format) as tar:
+        root = tarfile.TarInfo('owner-repo-abc/')
+        root.type = tarfile.DIRTYPE
+        tar.addfile(root)
+        for path, data in files.items():
+            info = tarfile.TarInfo(f'owner-repo-abc/{path}')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        for path, target in symlinks.items():
+            info = tarfile.TarInfo(f'owner-repo-abc/{path}')
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tar.addfile(info)
+    return buffer.getvalue()
+
+
+def parse(archive: bytes, chunk_size: int, max_file_bytes: int = 1024) -> dict:
+    entries = {}
+    parser = TarStreamParser(lambda entry: entries.__setitem__(entry['path'], entry), max_file_bytes)
+    for i in range(0, len(archive), chunk_size):
+        parser.feed(archive[i:i + chunk_size])
+    assert parser.done
+    return entries
+
+
+def test_blob_shas_and_long_names_across_chunk_boundaries():
+    long_path = 'deep/' + 'd' * 120 + '/' + 'f' * 120 + '.py'
+    files = {'README.md': b'# Demo\n', long_path: b'x = 1\n', 'big.bin': b'\0' * 3000, 'empty': b''}
+    for format in (tarfile.PAX_FORMAT, tarfile.GNU_FORMAT):
+        archive = make_tar(files, format=format, symlinks={'link': 'README.md'})
+        # Odd chunk sizes split headers, bodies and padding at every offset
+        for chunk_size in (1, 7, 511, 513, len(archive)):
+            entries = parse(archive, chunk_size)
+            for path, data in files.items():
+                assert entries[path]['sha'] == git_blob_sha(data), (format, chunk_size, path)
+                assert entries[path]['size'] == len(data)
+            assert entries[long_path]['data'] == b'x = 1\n'
+            # Over max_file_bytes: indexed with its SHA, body left out
+            assert entries['big.bin']['data'] is None
+            assert entries['link']['sha'] == git_blob_sha(b'README.md')
+            assert '' not in entries
+
+
+def test_matches_git_archive_and_tree():
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        git(repo, 'init', '-q', '-b', 'main')
+        (repo / 'src').mkdir()
+        (repo / 'src' / 'main.py').write_text('def main():\n    pass\n')
+        (repo / 'tests').mkdir()
+        (repo / 'tests' / 'test_main.py').write_text('import main\n')
+        (repo / '.gitattributes').write_text('tests/ export-ignore\n')
+        git(repo, 'add', '.')
+        git(repo, 'commit', '-q', '-m', 'initial')
+        archive = git(repo, 'archive', '--format=tar', '--prefix=owner-repo-abc/', 'HEAD')
+        tree = {}
+        for line in git(repo, 'ls-tree', '-r', 'HEAD').decode().splitlines():
+            meta, path = line.split('\t')
+            tree[path] = meta.split()[2]
+
+        entries = parse(archive, 1000)
+        for path, entry in entries.items():
+            if entry['type'] == 'blob':
+                assert entry['sha'] == tree[path]
+        # The archive isn't the commit tree: export-ignore paths are missing
+        assert 'tests/test_main.py' in tree and 'tests/test_main.py' not in entries
+
+
+def test_download_gunzips_and_rejects_truncated_archives():
+    archive = make_tar({'a.txt': b'hello\n'})
+
+    async def run(body: bytes):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)))
+        entries = []
+        await download_snapshot(client, 'https://api.github.com/repos/o/r/tarball/abc', {}, entries.append, 1024)
+        return entries
+
+    entries = asyncio.run(run(gzip.compress(archive)))
+    assert [e['path'] for e in entries if e['type'] == 'blob'] == ['a.txt']
+    try:
+        asyncio.run(run(archive[:600]))
+    except SnapshotError:
+        pass
+    else:
+        raise AssertionError("truncated archive was accepted")
+
+
+if __name__ == "__main__":
+    print("Starting snapshot tests...")
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"{name}: ok")